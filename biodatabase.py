@@ -0,0 +1,275 @@
+"""
+Optional SQLite database for the sold and unsold exobiology instead of the soldbiodata.json and notsoldbiodata.json.
+
+The scans are kept in the tables sold and unsold, indexed by Commander and system, body and species,
+so the plugin and the crawler only touch the rows they need instead of loading and rewriting whole files.
+Systems that have an entry in the soldbiodata.json without any sold scans are kept in systems,
+the Commanders that have an entry in either file in commanders.
+Every system and sold scan also keeps the shard of its system (see biodataformat.py),
+so the plugin reads a shard through an index as well.
+Everything can be exported back into the json files at any time.
+
+    python biodatabase.py import <folder>
+    python biodatabase.py export <folder>
+"""
+import argparse
+import os
+import sqlite3
+
+import biodataformat
+
+alphabet = "abcdefghijklmnopqrstuvwxyz0123456789-"
+
+DATABASE_FILE = "exobiology.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commanders (
+    cmdr TEXT PRIMARY KEY,
+    sold INTEGER NOT NULL DEFAULT 0,
+    unsold INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS systems (
+    cmdr TEXT NOT NULL,
+    letter TEXT NOT NULL,
+    system TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    UNIQUE (cmdr, letter, system)
+);
+CREATE TABLE IF NOT EXISTS sold (
+    cmdr TEXT NOT NULL,
+    letter TEXT NOT NULL,
+    system TEXT NOT NULL,
+    body TEXT NOT NULL,
+    species TEXT NOT NULL,
+    shard INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unsold (
+    cmdr TEXT NOT NULL,
+    system TEXT NOT NULL,
+    body TEXT NOT NULL,
+    species TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sold_system ON sold (cmdr, system);
+CREATE INDEX IF NOT EXISTS sold_body ON sold (cmdr, body);
+CREATE INDEX IF NOT EXISTS sold_species ON sold (cmdr, species);
+CREATE INDEX IF NOT EXISTS systems_shard ON systems (shard);
+CREATE INDEX IF NOT EXISTS sold_shard ON sold (shard);
+CREATE INDEX IF NOT EXISTS unsold_system ON unsold (cmdr, system);
+CREATE INDEX IF NOT EXISTS unsold_body ON unsold (cmdr, body);
+CREATE INDEX IF NOT EXISTS unsold_species ON unsold (cmdr, species);
+"""
+
+
+def scan(system: str, body: str, species: str) -> dict:
+    """Return a scan in the form the json files use."""
+    return {"species": species, "system": system, "body": body}
+
+
+class BiodataDatabase:
+    """
+    Connection to the exobiology.db.
+
+    Every change is a transaction of its own, rows are inserted in batches.
+    A connection can only be used by the thread that opened it.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open the database at path, creating the tables if needed."""
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the connection."""
+        self.connection.close()
+
+    def is_empty(self) -> bool:
+        """Tell if there is nothing in the database yet."""
+        return self.connection.execute("SELECT 1 FROM commanders LIMIT 1").fetchone() is None
+
+    # region json layout
+
+    def read_sold(self) -> dict:
+        """Return all sold exobiology like the content of the soldbiodata.json."""
+        solddata = {}
+        for cmdr, in self.connection.execute("SELECT cmdr FROM commanders WHERE sold ORDER BY rowid"):
+            solddata[cmdr] = {letter: {} for letter in alphabet}
+        for cmdr, letter, system in self.connection.execute("SELECT cmdr, letter, system FROM systems ORDER BY rowid"):
+            solddata[cmdr][letter][system] = []
+        for cmdr, letter, system, body, species in self.connection.execute(
+                "SELECT cmdr, letter, system, body, species FROM sold ORDER BY rowid"):
+            solddata[cmdr][letter][system].append(scan(system, body, species))
+        return solddata
+
+    def sold_cmdrs(self) -> list:
+        """Return the Commanders in the content of the soldbiodata.json."""
+        return [cmdr for cmdr, in self.connection.execute("SELECT cmdr FROM commanders WHERE sold ORDER BY rowid")]
+
+    def read_sold_shard(self, index: int) -> dict:
+        """Return the sold exobiology of the systems in a shard, like a shard of the json files."""
+        solddata = {}
+        for cmdr, letter, system in self.connection.execute(
+                "SELECT cmdr, letter, system FROM systems WHERE shard = ? ORDER BY rowid", (index,)):
+            if cmdr not in solddata.keys():
+                solddata[cmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
+            solddata[cmdr][letter][system] = []
+        for cmdr, letter, system, body, species in self.connection.execute(
+                "SELECT cmdr, letter, system, body, species FROM sold WHERE shard = ? ORDER BY rowid", (index,)):
+            if cmdr not in solddata.keys():
+                solddata[cmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
+            if system not in solddata[cmdr][letter].keys():
+                solddata[cmdr][letter][system] = []
+            solddata[cmdr][letter][system].append(scan(system, body, species))
+        return solddata
+
+    def write_sold_shard(self, index: int, solddata: dict) -> None:
+        """Replace the sold exobiology of the systems in a shard with solddata, in the layout of read_sold_shard."""
+        with self.connection:
+            self.connection.execute("DELETE FROM systems WHERE shard = ?", (index,))
+            self.connection.execute("DELETE FROM sold WHERE shard = ?", (index,))
+            self.connection.executemany(
+                "INSERT INTO systems (cmdr, letter, system, shard) VALUES (?, ?, ?, ?)",
+                ((cmdr, letter, system, index)
+                 for cmdr in solddata for letter in solddata[cmdr] for system in solddata[cmdr][letter]))
+            self.connection.executemany(
+                "INSERT INTO sold (cmdr, letter, system, body, species, shard) VALUES (?, ?, ?, ?, ?, ?)",
+                ((cmdr, letter, item["system"], item["body"], item["species"], index)
+                 for cmdr in solddata for letter in solddata[cmdr] for system in solddata[cmdr][letter]
+                 for item in solddata[cmdr][letter][system]))
+
+    def add_sold_cmdrs(self, cmdrs: list) -> None:
+        """Give cmdrs an entry in the sold exobiology, even without any sold scans."""
+        with self.connection:
+            for cmdr in cmdrs:
+                self.connection.execute("INSERT OR IGNORE INTO commanders (cmdr) VALUES (?)", (cmdr,))
+                self.connection.execute("UPDATE commanders SET sold = 1 WHERE cmdr = ?", (cmdr,))
+
+    def read_unsold(self) -> dict:
+        """Return all unsold exobiology like the content of the notsoldbiodata.json."""
+        notsolddata = {}
+        for cmdr, in self.connection.execute("SELECT cmdr FROM commanders WHERE unsold ORDER BY rowid"):
+            notsolddata[cmdr] = []
+        for cmdr, system, body, species in self.connection.execute(
+                "SELECT cmdr, system, body, species FROM unsold ORDER BY rowid"):
+            notsolddata[cmdr].append(scan(system, body, species))
+        return notsolddata
+
+    def write(self, solddata: dict = None, notsolddata: dict = None, cmdrs: list = None, clear: bool = False) -> None:
+        """
+        Replace the sold and unsold exobiology of the Commanders in cmdrs (all in the data by default).
+
+        solddata and notsolddata are in the layout of the soldbiodata.json and notsoldbiodata.json.
+        With clear everything else in the database goes as well.
+        """
+        if cmdrs is None:
+            cmdrs = list((solddata or {}).keys()) + [cmdr for cmdr in (notsolddata or {}).keys()
+                                                     if cmdr not in (solddata or {}).keys()]
+        with self.connection:
+            if clear:
+                for table in ["commanders", "systems", "sold", "unsold"]:
+                    self.connection.execute(f"DELETE FROM {table}")
+            for cmdr in cmdrs:
+                self.connection.execute("INSERT OR IGNORE INTO commanders (cmdr) VALUES (?)", (cmdr,))
+                if solddata is not None and cmdr in solddata.keys():
+                    self.connection.execute("UPDATE commanders SET sold = 1 WHERE cmdr = ?", (cmdr,))
+                    self.connection.execute("DELETE FROM systems WHERE cmdr = ?", (cmdr,))
+                    self.connection.execute("DELETE FROM sold WHERE cmdr = ?", (cmdr,))
+                    self.connection.executemany(
+                        "INSERT INTO systems (cmdr, letter, system, shard) VALUES (?, ?, ?, ?)",
+                        ((cmdr, letter, system, biodataformat.shard_of(system))
+                         for letter in solddata[cmdr] for system in solddata[cmdr][letter]))
+                    self.connection.executemany(
+                        "INSERT INTO sold (cmdr, letter, system, body, species, shard) VALUES (?, ?, ?, ?, ?, ?)",
+                        ((cmdr, letter, item["system"], item["body"], item["species"],
+                          biodataformat.shard_of(item["system"]))
+                         for letter in solddata[cmdr] for system in solddata[cmdr][letter]
+                         for item in solddata[cmdr][letter][system]))
+                if notsolddata is not None and cmdr in notsolddata.keys():
+                    self.connection.execute("UPDATE commanders SET unsold = 1 WHERE cmdr = ?", (cmdr,))
+                    self.connection.execute("DELETE FROM unsold WHERE cmdr = ?", (cmdr,))
+                    self.connection.executemany(
+                        "INSERT INTO unsold (cmdr, system, body, species) VALUES (?, ?, ?, ?)",
+                        ((cmdr, item["system"], item["body"], item["species"]) for item in notsolddata[cmdr]))
+
+    def import_json(self, directory: str) -> None:
+        """Replace the content of the database with the soldbiodata.json and notsoldbiodata.json in directory."""
+        stores = []
+        for file in ["soldbiodata.json", "notsoldbiodata.json"]:
+            stores.append({})
+            if os.path.exists(os.path.join(directory, file)):
+                stores[-1] = biodataformat.read(os.path.join(directory, file))
+        self.write(*stores, clear=True)
+
+    def export_json(self, directory: str) -> None:
+        """Write the content of the database into the soldbiodata.json and notsoldbiodata.json in directory."""
+        biodataformat.write(os.path.join(directory, "soldbiodata.json"), self.read_sold())
+        biodataformat.write(os.path.join(directory, "notsoldbiodata.json"), self.read_unsold())
+
+    # endregion
+
+    # region plugin
+
+    def apply(self, record: dict) -> None:
+        """Apply a scan or sell record of the biodatalog (see biodatalog.apply_record) in one transaction."""
+        cmdr = record["cmdr"]
+        execute = self.connection.execute
+        with self.connection:
+            execute("INSERT OR IGNORE INTO commanders (cmdr) VALUES (?)", (cmdr,))
+            if record["event"] == "scan":
+                data = record["data"]
+                execute("UPDATE commanders SET unsold = 1 WHERE cmdr = ?", (cmdr,))
+                known = execute("SELECT 1 FROM unsold WHERE cmdr = ? AND system = ? AND body = ? AND species = ?",
+                                (cmdr, data["system"], data["body"], data["species"])).fetchone()
+                if known is None:
+                    execute("INSERT INTO unsold (cmdr, system, body, species) VALUES (?, ?, ?, ?)",
+                            (cmdr, data["system"], data["body"], data["species"]))
+            elif record["event"] == "sell":
+                execute("UPDATE commanders SET sold = 1, unsold = 1 WHERE cmdr = ?", (cmdr,))
+                for letter, systems in record["sold"].items():
+                    for system, items in systems.items():
+                        shard = biodataformat.shard_of(system)
+                        execute("INSERT OR IGNORE INTO systems (cmdr, letter, system, shard) VALUES (?, ?, ?, ?)",
+                                (cmdr, letter, system, shard))
+                        for item in items:
+                            known = execute("SELECT 1 FROM sold WHERE cmdr = ? AND system = ? AND body = ? "
+                                            + "AND species = ? AND letter = ?",
+                                            (cmdr, system, item["body"], item["species"], letter)).fetchone()
+                            if known is None:
+                                execute("INSERT INTO sold (cmdr, letter, system, body, species, shard) "
+                                        + "VALUES (?, ?, ?, ?, ?, ?)",
+                                        (cmdr, letter, system, item["body"], item["species"], shard))
+                execute("DELETE FROM unsold WHERE cmdr = ?", (cmdr,))
+                self.connection.executemany("INSERT INTO unsold (cmdr, system, body, species) VALUES (?, ?, ?, ?)",
+                                            ((cmdr, item["system"], item["body"], item["species"])
+                                             for item in record["unsold"]))
+
+    # endregion
+
+
+def open_database(directory: str) -> BiodataDatabase:
+    """Open the exobiology.db in directory, importing the json files there when it is new."""
+    path = os.path.join(directory, DATABASE_FILE)
+    database = BiodataDatabase(path)
+    if database.is_empty():
+        database.import_json(directory)
+    return database
+
+
+def main(argv: list = None) -> None:
+    """Import the json files of a folder into its exobiology.db or export the database into them."""
+    parser = argparse.ArgumentParser(description="Move exobiology between the json files and the SQLite database.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("folder", help="folder with the soldbiodata.json, notsoldbiodata.json and exobiology.db")
+    args = parser.parse_args(argv)
+
+    database = BiodataDatabase(os.path.join(args.folder, DATABASE_FILE))
+    if args.action == "import":
+        database.import_json(args.folder)
+    else:
+        database.export_json(args.folder)
+    database.close()
+
+
+if __name__ == "__main__":
+    main()
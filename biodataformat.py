@@ -0,0 +1,268 @@
+"""
+Compact on-disk format of the soldbiodata.json and notsoldbiodata.json.
+
+The plugin and the crawler work on the plain layout, {cmdr: {letter: {system: [scan, ...]}}} for the sold
+and {cmdr: [scan, ...]} for the unsold exobiology, with every scan as {"species", "system", "body"}.
+Written like that with indentation most of the files are whitespace, repeated keys and empty letters.
+
+On disk the scans of every Commander are kept in columns instead and the names of systems and species
+only once in string tables of the file. Bodies named after their system only keep what comes after the system name.
+Files in the plain layout of earlier versions are still read, the plugin converts them when it starts.
+
+    {"version": 1, "kind": "sold", "systems": [name, ...], "species": [name, ...],
+     "cmdrs": {cmdr: {"letters": "aab", "systems": [system, ...], "counts": [scans, ...],
+                      "species": [species, ...], "bodies": [body, ...]}}}
+
+For the sold exobiology letters, systems and counts have an entry per system in the plain layout and
+species and bodies one per scan in the same order. Unsold exobiology has systems, species and bodies per scan.
+
+The sold exobiology is split up further by a hash of the system name into shards, each a file like the above
+compressed with gzip in the soldbiodata folder next to the soldbiodata.json.
+The soldbiodata.json itself only lists the Commanders,
+
+    {"version": 1, "kind": "sold", "shards": 64, "cmdrs": [cmdr, ...]}
+
+so the plugin only has to read the shard of a system when it needs its scans (see biodatastore.py).
+"""
+import gzip
+import itertools
+import os
+import zlib
+
+import jsonbackend
+
+alphabet = "abcdefghijklmnopqrstuvwxyz0123456789-"
+
+VERSION = 1
+
+# Shards the sold exobiology is split up into
+SHARDS = 64
+
+# Kind of exobiology in each of the files
+KINDS = {"soldbiodata.json": "sold", "notsoldbiodata.json": "unsold"}
+
+
+def is_compact(data) -> bool:
+    """Tell if the content of a file is in the compact format, rather than the plain layout."""
+    return isinstance(data, dict) and isinstance(data.get("version"), int)
+
+
+def is_sharded(data) -> bool:
+    """Tell if the content of a soldbiodata.json only lists the Commanders, with the scans in shards."""
+    return is_compact(data) and "shards" in data.keys()
+
+
+def shard_of(system: str, shards: int = SHARDS) -> int:
+    """Return the shard the scans of system are kept in, the same on every run unlike hash()."""
+    return zlib.crc32(system.encode("utf8")) % shards
+
+
+def shard_path(path: str, index: int) -> str:
+    """Return the path of a shard of the soldbiodata.json at path."""
+    return os.path.join(os.path.splitext(path)[0], f"{index:02d}.json.gz")
+
+
+def files(path: str) -> list:
+    """Return the paths of all files the exobiology at path is kept in, shards included."""
+    paths = [path]
+    with open(path, "r", encoding="utf8") as f:
+        data = jsonbackend.load(f)
+    if is_sharded(data):
+        paths += [shard_path(path, index) for index in range(data["shards"])
+                  if os.path.exists(shard_path(path, index))]
+    return paths
+
+
+def split(solddata: dict, shards: int = SHARDS) -> dict:
+    """Split the sold exobiology in the plain layout up into {index: plain layout of the systems in the shard}."""
+    parts = {index: {} for index in range(shards)}
+    for cmdr, cmdrdata in solddata.items():
+        for letter, bucket in cmdrdata.items():
+            for system, scans in bucket.items():
+                part = parts[shard_of(system, shards)]
+                if cmdr not in part.keys():
+                    part[cmdr] = {letter: {} for letter in alphabet}
+                part[cmdr].setdefault(letter, {})[system] = scans
+    return parts
+
+
+def merge(cmdrs: list, parts: list) -> dict:
+    """Put the sold exobiology of cmdrs split up by split back together, Commanders without any scans included."""
+    solddata = {cmdr: {letter: {} for letter in alphabet} for cmdr in cmdrs}
+    for part in parts:
+        for cmdr, cmdrdata in part.items():
+            if cmdr not in solddata.keys():
+                solddata[cmdr] = {letter: {} for letter in alphabet}
+            for letter, bucket in cmdrdata.items():
+                solddata[cmdr].setdefault(letter, {}).update(bucket)
+    return solddata
+
+
+def manifest(cmdrs: list, shards: int = SHARDS) -> dict:
+    """Return the content of a soldbiodata.json with its scans in shards."""
+    return {"version": VERSION, "kind": "sold", "shards": shards, "cmdrs": list(cmdrs)}
+
+
+def encode_body(system: str, body: str) -> str:
+    """Shorten a body named after its system to the rest of its name, other names are kept behind a =."""
+    if body.startswith(system) and not body.startswith(system + "="):
+        return body[len(system):]
+    return "=" + body
+
+
+def decode_body(system: str, body: str) -> str:
+    """Turn a body written by encode_body back into its name."""
+    if body.startswith("="):
+        return body[1:]
+    return system + body
+
+
+class StringTable:
+    """Names in the order they first came up."""
+
+    def __init__(self) -> None:
+        """Start out empty."""
+        self.indices = {}
+
+    def index(self, name: str) -> int:
+        """Return the index of name, adding it if needed."""
+        index = self.indices.get(name)
+        if index is None:
+            index = self.indices[name] = len(self.indices)
+        return index
+
+    def names(self) -> list:
+        """Return the names by their index."""
+        return list(self.indices.keys())
+
+
+def encode(data: dict, kind: str) -> dict:
+    """Return the sold or unsold exobiology (kind) in the plain layout in the compact format."""
+    systems = StringTable()
+    species = StringTable()
+    cmdrs = {}
+    for cmdr, cmdrdata in data.items():
+        if kind == "sold":
+            letters = []
+            systemcolumn = []
+            counts = []
+            items = []
+            # Scans filed under a system other than their own, by their position
+            othersystems = {}
+            for letter, bucket in cmdrdata.items():
+                for system, scans in bucket.items():
+                    letters.append(letter)
+                    systemcolumn.append(systems.index(system))
+                    counts.append(len(scans))
+                    for item in scans:
+                        if item["system"] != system:
+                            othersystems[str(len(items))] = systems.index(item["system"])
+                        items.append(item)
+            columns = {"letters": "".join(letters) if all(len(letter) == 1 for letter in letters) else letters,
+                       "systems": systemcolumn, "counts": counts}
+            if othersystems != {}:
+                columns["othersystems"] = othersystems
+        else:
+            items = cmdrdata
+            columns = {"systems": [systems.index(item["system"]) for item in items]}
+        columns["species"] = [species.index(item["species"]) for item in items]
+        columns["bodies"] = [encode_body(item["system"], item["body"]) for item in items]
+        cmdrs[cmdr] = columns
+    return {"version": VERSION, "kind": kind, "systems": systems.names(), "species": species.names(), "cmdrs": cmdrs}
+
+
+def decode(data: dict) -> dict:
+    """Return the content of a file in the plain layout, whichever format it is in."""
+    if not is_compact(data):
+        return data
+    if data["version"] > VERSION:
+        raise ValueError(f"Exobiology file of version {data['version']}, this version only reads up to {VERSION}")
+    if is_sharded(data):
+        raise ValueError("The scans of a sharded soldbiodata.json are in its shards, read it with read")
+    systems = data["systems"]
+    species = data["species"]
+    result = {}
+    for cmdr, columns in data["cmdrs"].items():
+        speciescolumn = columns["species"]
+        bodies = columns["bodies"]
+        if data["kind"] == "unsold":
+            result[cmdr] = [{"species": species[speciescolumn[i]], "system": systems[system],
+                             "body": decode_body(systems[system], bodies[i])}
+                            for i, system in enumerate(columns["systems"])]
+            continue
+        othersystems = columns.get("othersystems", {})
+        cmdrdata = {letter: {} for letter in alphabet}
+        scans = zip(map(species.__getitem__, speciescolumn), bodies)
+        position = 0
+        for letter, system, count in zip(columns["letters"], columns["systems"], columns["counts"]):
+            name = systems[system]
+            if letter not in cmdrdata.keys():
+                cmdrdata[letter] = {}
+            if othersystems == {}:
+                # decode_body inlined, this is most of the time spent on loading
+                cmdrdata[letter][name] = [{"species": scanspecies, "system": name,
+                                           "body": body[1:] if body[:1] == "=" else name + body}
+                                          for scanspecies, body in itertools.islice(scans, count)]
+            else:
+                cmdrdata[letter][name] = []
+                for i, (scanspecies, body) in enumerate(itertools.islice(scans, count), position):
+                    own = systems[othersystems[str(i)]] if str(i) in othersystems else name
+                    cmdrdata[letter][name].append({"species": scanspecies, "system": own,
+                                                   "body": decode_body(own, body)})
+            position += count
+        result[cmdr] = cmdrdata
+    return result
+
+
+def dumps(data: dict, kind: str) -> str:
+    """Return the sold or unsold exobiology (kind) in the plain layout as the text of a file."""
+    return jsonbackend.dumps(encode(data, kind))
+
+
+def dumps_shard(data: dict) -> bytes:
+    """Return the sold exobiology of a shard in the plain layout as the compressed content of its file."""
+    # Without a timestamp the same shard always gives the same bytes
+    return gzip.compress(dumps(data, "sold").encode("utf8"), compresslevel=6, mtime=0)
+
+
+def write_file(path: str, content) -> None:
+    """Replace the content of a file with a str or bytes in one go, so it is never left half written."""
+    if isinstance(content, bytes):
+        with open(path + ".tmp", "wb") as f:
+            f.write(content)
+    else:
+        with open(path + ".tmp", "w", encoding="utf8") as f:
+            f.write(content)
+    os.replace(path + ".tmp", path)
+
+
+def read_shard(path: str, index: int) -> dict:
+    """Return the sold exobiology in a shard of the soldbiodata.json at path in the plain layout."""
+    if not os.path.exists(shard_path(path, index)):
+        return {}
+    with open(shard_path(path, index), "rb") as f:
+        return decode(jsonbackend.loads(gzip.decompress(f.read())))
+
+
+def read(path: str) -> dict:
+    """Return the content of the soldbiodata.json or notsoldbiodata.json at path in the plain layout."""
+    with open(path, "r", encoding="utf8") as f:
+        data = jsonbackend.load(f)
+    if is_sharded(data):
+        return merge(data["cmdrs"], [read_shard(path, index) for index in range(data["shards"])])
+    return decode(data)
+
+
+def write(path: str, data: dict, kind: str = None) -> None:
+    """Write the exobiology in the plain layout to path, kind is taken from the file name by default."""
+    if kind is None:
+        kind = KINDS[os.path.basename(path)]
+    if kind == "sold":
+        # Every shard is written, so none is left over from earlier
+        os.makedirs(os.path.splitext(path)[0], exist_ok=True)
+        for index, part in split(data).items():
+            write_file(shard_path(path, index), dumps_shard(part))
+        # Only now that the shards are there the soldbiodata.json may point to them
+        write_file(path, jsonbackend.dumps(manifest(data.keys())))
+        return
+    write_file(path, dumps(data, kind))
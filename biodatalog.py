@@ -0,0 +1,89 @@
+"""
+Records of the scans and sells the plugin sees while EDMC is running.
+
+The plugin applies them to the stores it keeps in memory (see biodatastore.py),
+the exobiology.db applies them one by one when saving (see biodatabase.py).
+Until they are saved they are also appended to the biodatalog.jsonl next to the soldbiodata.json
+and notsoldbiodata.json as one line each, so a crash doesn't lose them. What is left of the log
+is applied again when the plugin starts. Applying a record a second time changes nothing.
+"""
+import os
+
+import jsonbackend
+
+alphabet = "abcdefghijklmnopqrstuvwxyz0123456789-"
+
+LOG_FILE = "biodatalog.jsonl"
+
+
+def scan_record(cmdr: str, data: dict) -> dict:
+    """Record an analysed but unsold scan as {"species", "system", "body"} of cmdr."""
+    return {"event": "scan", "cmdr": cmdr, "data": data}
+
+
+def sell_record(cmdr: str, sold: dict, unsold: list) -> dict:
+    """
+    Record a sale of cmdr.
+
+    sold holds the scans that were sold as {letter: {system: [data, ...]}},
+    unsold the scans of cmdr that are still unsold afterwards.
+    """
+    # Letters without any system are left out to keep the record small
+    return {"event": "sell", "cmdr": cmdr, "sold": {letter: systems for letter, systems in sold.items() if systems},
+            "unsold": unsold}
+
+
+def apply_record(record: dict, solddata: dict, notsolddata: dict) -> None:
+    """Apply a record to the contents of the soldbiodata.json and notsoldbiodata.json."""
+    cmdr = record["cmdr"]
+    if record["event"] == "scan":
+        if cmdr not in notsolddata.keys():
+            notsolddata[cmdr] = []
+        if record["data"] not in notsolddata[cmdr]:
+            notsolddata[cmdr].append(record["data"])
+    elif record["event"] == "sell":
+        if cmdr not in solddata.keys():
+            solddata[cmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
+        for letter, systems in record["sold"].items():
+            for system, items in systems.items():
+                if system not in solddata[cmdr][letter].keys():
+                    solddata[cmdr][letter][system] = []
+                for item in items:
+                    if item not in solddata[cmdr][letter][system]:
+                        solddata[cmdr][letter][system].append(item)
+        notsolddata[cmdr] = list(record["unsold"])
+
+
+def write_store(file: str, data) -> None:
+    """Replace the content of a json file in one go, so it is never left half written."""
+    with open(file + ".tmp", "w", encoding="utf8") as f:
+        jsonbackend.dump(data, f, indent=True)
+    os.replace(file + ".tmp", file)
+
+
+def read_log(path: str) -> list:
+    """Return the records in the log at path, leaving out a last line that was cut off."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            try:
+                records.append(jsonbackend.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def open_log(path: str):
+    """Open the log at path for appending records, without continuing a line that was cut off."""
+    cutoff = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            cutoff = f.read(1) != b"\n"
+    log = open(path, "a", encoding="utf8")
+    if cutoff:
+        log.write("\n")
+        log.flush()
+    return log
@@ -0,0 +1,444 @@
+"""
+In-memory store of the sold and unsold exobiology and the Commander states of the plugin.
+
+The plugin only works on the contents kept here. A writer thread saves what changed into
+the soldbiodata.json and notsoldbiodata.json (or the exobiology.db) and the state files of the Commanders
+every interval seconds, so the journal event handlers never wait for the disk.
+With an interval of 0 every change is saved right away, still by the writer thread.
+Scans and sells are appended to the biodatalog.jsonl (see biodatalog.py) right away as well,
+it is emptied with every save and applied again by read, so a crash doesn't lose them.
+A crash only loses the changes to the Commander states of the last interval.
+
+Every Commander has a file of its own in the cmdrstates folder, read the first time the Commander is needed.
+The cmdrstates.json of earlier versions is split up into them.
+
+Of the sold exobiology only the shards (see biodataformat.py) of the systems looked at or sold in are read.
+The ones used last stay in memory, the least recently used are dropped again once all of them take up
+more than the budget and read again from the compressed shard files or the exobiology.db when needed.
+Changed shards stay in memory until they are saved, only they are written again.
+"""
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+import biodatabase
+import biodataformat
+import jsonbackend
+from biodatalog import LOG_FILE, apply_record, open_log, read_log, sell_record, write_store
+
+# Default seconds between two saves
+FLUSH_INTERVAL = 5
+
+# Default megabytes of sold exobiology kept in memory
+CACHE_BUDGET = 16
+
+# Rough bytes a Commander, a system and a scan in a shard take up in memory
+CMDR_BYTES = 2500
+SYSTEM_BYTES = 200
+SCAN_BYTES = 300
+
+STATES_FOLDER = "cmdrstates"
+
+
+def copy(data):
+    """Return a copy of data that doesn't share anything with it."""
+    return jsonbackend.loads(jsonbackend.dumps(data))
+
+
+def footprint(shard: dict) -> int:
+    """Estimate the bytes a shard in the plain layout takes up in memory, without looking at every scan."""
+    size = 0
+    for cmdrdata in shard.values():
+        size += CMDR_BYTES
+        for bucket in cmdrdata.values():
+            size += SYSTEM_BYTES * len(bucket)
+            for scans in bucket.values():
+                size += SCAN_BYTES * len(scans)
+    return size
+
+
+class BiodataStore:
+    """
+    Sold and unsold exobiology and Commander states of the plugin in directory.
+
+    Everything is guarded by lock, as the writer thread reads what the Tk thread changes.
+    """
+
+    def __init__(self, logger, directory: str, interval: int = FLUSH_INTERVAL, database: bool = False,
+                 budget: int = CACHE_BUDGET) -> None:
+        """
+        Load the stores in directory, from the exobiology.db with database, and start the writer thread.
+
+        Up to budget megabytes of sold exobiology are kept in memory.
+        """
+        self.logger = logger
+        self.directory = directory
+        self.interval = interval
+        self.database = database
+        self.budget = budget
+        self.lock = threading.Lock()
+        # Only one save at a time, no matter the thread
+        self.savelock = threading.Lock()
+        # Changed since the last save, as file names and shards
+        self.dirty = set()
+        self.dirtyshards = set()
+        # Shards being written right now, they must not be dropped before they are saved
+        self.saving = set()
+        # Records applied since the last save, saved into the exobiology.db one by one.
+        # They are in the biodatalog.jsonl as well, along with the ones being saved right now.
+        self.records = []
+        # Shards that were in memory when needed, had to be read and were dropped again
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.read()
+        self.split_states()
+        # States of the Commanders read so far
+        self.cmdrstates = {}
+        # Commanders whose state changed since the last save
+        self.dirtystates = set()
+        # While a crawl works on the stores nothing gets saved, the changes are applied on top of its results after
+        self.held = False
+        self.log = open_log(os.path.join(directory, LOG_FILE))
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name="AST store writer", daemon=True)
+        self.thread.start()
+
+    def read(self) -> None:
+        """
+        Read the unsold exobiology and the Commanders of the sold from the json files or the exobiology.db.
+
+        The records left in the biodatalog.jsonl are applied on top.
+        """
+        self.shardcount = biodataformat.SHARDS
+        # Shards in memory, the least recently used first, and the bytes they take up
+        self.shards = OrderedDict()
+        self.sizes = {}
+        if self.database:
+            database = biodatabase.open_database(self.directory)
+            try:
+                self.soldcmdrs = database.sold_cmdrs()
+                self.notsolddata = database.read_unsold()
+            finally:
+                database.close()
+        else:
+            self.read_files()
+        # Scans and sells that were not saved before EDMC stopped or the crawl started
+        for record in read_log(os.path.join(self.directory, LOG_FILE)):
+            self.apply_record(record)
+
+    def read_files(self) -> None:
+        """Read the unsold exobiology and the Commanders of the sold from the json files."""
+        with open(self.sold_path(), "r", encoding="utf8") as f:
+            data = jsonbackend.load(f)
+        if biodataformat.is_sharded(data):
+            self.shardcount = data["shards"]
+            self.soldcmdrs = data["cmdrs"]
+        else:
+            # A plain soldbiodata.json, like the empty one of a new installation, is split up with the next save
+            solddata = biodataformat.decode(data)
+            self.soldcmdrs = list(solddata.keys())
+            for index, part in biodataformat.split(solddata, self.shardcount).items():
+                self.shards[index] = part
+                self.sizes[index] = footprint(part)
+            self.dirty.add("soldbiodata.json")
+            self.dirtyshards.update(self.shards.keys())
+        self.notsolddata = biodataformat.read(os.path.join(self.directory, "notsoldbiodata.json"))
+
+    # region sold shards
+
+    def sold_path(self) -> str:
+        """Return the path of the soldbiodata.json."""
+        return os.path.join(self.directory, "soldbiodata.json")
+
+    def shard(self, index: int) -> dict:
+        """Return a shard of the sold exobiology, read if it is not in memory. Only call with lock held."""
+        if index in self.shards.keys():
+            self.hits += 1
+            self.shards.move_to_end(index)
+            return self.shards[index]
+        self.misses += 1
+        if self.database:
+            database = biodatabase.BiodataDatabase(os.path.join(self.directory, biodatabase.DATABASE_FILE))
+            try:
+                shard = database.read_sold_shard(index)
+            finally:
+                database.close()
+        else:
+            shard = biodataformat.read_shard(self.sold_path(), index)
+        self.shards[index] = shard
+        self.sizes[index] = footprint(shard)
+        self.evict()
+        return shard
+
+    def evict(self) -> None:
+        """Drop the least recently used saved shards until the rest fits into the budget. Only call with lock held."""
+        size = sum(self.sizes.values())
+        # The shard used last always stays
+        for index in list(self.shards.keys())[:-1]:
+            if size <= self.budget * 1024 * 1024:
+                break
+            if index in self.dirtyshards or index in self.saving:
+                continue
+            size -= self.sizes.pop(index)
+            del self.shards[index]
+            self.evictions += 1
+
+    def set_budget(self, budget: int) -> None:
+        """Change the megabytes of sold exobiology kept in memory."""
+        with self.lock:
+            self.budget = budget
+            self.evict()
+
+    def cache_stats(self) -> dict:
+        """Return the hits, misses and evictions of the shards so far and the shards and bytes in memory."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "shards": len(self.shards), "bytes": sum(self.sizes.values())}
+
+    def apply_record(self, record: dict) -> None:
+        """Apply a record like biodatalog.apply_record, only touching the shards of the sold systems in it."""
+        cmdr = record["cmdr"]
+        if record["event"] == "sell":
+            if cmdr not in self.soldcmdrs:
+                self.soldcmdrs.append(cmdr)
+                self.dirty.add("soldbiodata.json")
+            for letter, systems in record["sold"].items():
+                for system, items in systems.items():
+                    index = biodataformat.shard_of(system, self.shardcount)
+                    # Marked first, so it isn't dropped before it is saved
+                    self.dirtyshards.add(index)
+                    apply_record(sell_record(cmdr, {letter: {system: items}}, record["unsold"]), self.shard(index),
+                                 self.notsolddata)
+                    self.sizes[index] = footprint(self.shards[index])
+        # The sold scans are in their shards already
+        apply_record(dict(record, sold={}), {}, self.notsolddata)
+        self.dirty.add("notsoldbiodata.json")
+        self.records.append(record)
+
+    # endregion
+
+    # region Commander states
+
+    def state_file(self, cmdr: str) -> str:
+        """Return the path of the state file of cmdr, its name escaped so that any name works."""
+        return os.path.join(self.directory, STATES_FOLDER, quote(cmdr, safe="") + ".json")
+
+    def split_states(self) -> None:
+        """Split the cmdrstates.json of earlier versions into a file per Commander."""
+        os.makedirs(os.path.join(self.directory, STATES_FOLDER), exist_ok=True)
+        old = os.path.join(self.directory, "cmdrstates.json")
+        if not os.path.exists(old):
+            # Outside of Windows older versions wrote it next to the plugin folder instead
+            old = self.directory + "\\cmdrstates.json"
+        if not os.path.exists(old):
+            return
+        with open(old, "r", encoding="utf8") as f:
+            cmdrstates = jsonbackend.load(f)
+        for cmdr, state in cmdrstates.items():
+            if not os.path.exists(self.state_file(cmdr)):
+                write_store(self.state_file(cmdr), state)
+        os.remove(old)
+
+    def cmdrstate(self, cmdr: str) -> list:
+        """Return a copy of the state of cmdr, None for a Commander without one."""
+        with self.lock:
+            if cmdr not in self.cmdrstates.keys():
+                if not os.path.exists(self.state_file(cmdr)):
+                    return None
+                with open(self.state_file(cmdr), "r", encoding="utf8") as f:
+                    self.cmdrstates[cmdr] = jsonbackend.load(f)
+            return copy(self.cmdrstates[cmdr])
+
+    def set_cmdrstate(self, cmdr: str, values: list) -> None:
+        """Change the state of cmdr, only saved when it differs from what is known."""
+        values = copy(values)
+        with self.lock:
+            if self.cmdrstates.get(cmdr) == values:
+                return
+            self.cmdrstates[cmdr] = values
+            self.dirtystates.add(cmdr)
+        self.changed()
+
+    # endregion
+
+    # region changes
+
+    def changed(self) -> None:
+        """Wake the writer thread up if every change is to be saved right away."""
+        if self.interval <= 0:
+            self.wakeup.set()
+
+    def apply(self, record: dict) -> None:
+        """Apply a scan or sell record of biodatalog to the exobiology and append it to the log."""
+        line = jsonbackend.dumps(record)
+        # Decoded again so it doesn't share anything with the caller
+        record = jsonbackend.loads(line)
+        with self.lock:
+            self.apply_record(record)
+            self.log.write(line + "\n")
+            self.log.flush()
+        self.changed()
+
+    # endregion
+
+    # region reading
+
+    def unsold(self) -> dict:
+        """Return a copy of the unsold exobiology of all Commanders."""
+        with self.lock:
+            return copy(self.notsolddata)
+
+    def system_scans(self, cmdr: str, letter: str, system: str) -> tuple:
+        """Return the sold scans of cmdr in system filed under letter and the unsold ones in system."""
+        with self.lock:
+            shard = self.shard(biodataformat.shard_of(system, self.shardcount))
+            sold = list(shard.get(cmdr, {}).get(letter, {}).get(system, []))
+            notsold = [item for item in self.notsolddata.get(cmdr, []) if item["system"] == system]
+        return sold, notsold
+
+    # endregion
+
+    # region saving
+
+    def flush(self, force: bool = False) -> None:
+        """Save what changed, unless a crawl holds the stores and not forced."""
+        with self.savelock:
+            with self.lock:
+                if self.held and not force:
+                    return
+                # Path and content of every file to write
+                files = {}
+                database = self.database
+                dirty, dirtyshards, dirtystates, records = self.dirty, self.dirtyshards, self.dirtystates, self.records
+                for cmdr in dirtystates:
+                    files[self.state_file(cmdr)] = jsonbackend.dumps(self.cmdrstates[cmdr], indent=True)
+                if not database:
+                    # The shards go first, the soldbiodata.json may only list Commanders that are in them
+                    for index in sorted(dirtyshards):
+                        files[biodataformat.shard_path(self.sold_path(), index)] = biodataformat.dumps_shard(
+                            self.shards[index])
+                    if "soldbiodata.json" in dirty:
+                        files[self.sold_path()] = jsonbackend.dumps(biodataformat.manifest(self.soldcmdrs,
+                                                                                           self.shardcount))
+                    if "notsoldbiodata.json" in dirty:
+                        files[os.path.join(self.directory, "notsoldbiodata.json")] = biodataformat.dumps(
+                            self.notsolddata, "unsold")
+                # Changes made while writing count for the next save
+                self.dirty = set()
+                self.dirtyshards = set()
+                self.dirtystates = set()
+                self.records = []
+                self.saving = dirtyshards
+            # The disk is only touched once the lock is free again
+            try:
+                if files != {}:
+                    os.makedirs(os.path.splitext(self.sold_path())[0], exist_ok=True)
+                for path, content in files.items():
+                    biodataformat.write_file(path, content)
+                if database and records != []:
+                    connection = biodatabase.BiodataDatabase(os.path.join(self.directory,
+                                                                          biodatabase.DATABASE_FILE))
+                    try:
+                        for record in records:
+                            connection.apply(record)
+                    finally:
+                        connection.close()
+            except Exception:
+                # Nothing is lost, all of it gets written again with the next save
+                with self.lock:
+                    self.dirty |= dirty
+                    self.dirtyshards |= dirtyshards
+                    self.dirtystates |= dirtystates
+                    self.records = records + self.records
+                    self.saving = set()
+                raise
+            with self.lock:
+                self.saving = set()
+                # Saved shards may be dropped now
+                self.evict()
+                # Only the records applied since are left to log
+                self.log.truncate(0)
+                for record in self.records:
+                    self.log.write(jsonbackend.dumps(record) + "\n")
+                self.log.flush()
+
+    def run(self) -> None:
+        """Save the changes every interval seconds until stopped, runs in the writer thread."""
+        while not self.stopping:
+            self.wakeup.wait(self.interval if self.interval > 0 else None)
+            self.wakeup.clear()
+            if self.stopping:
+                break
+            try:
+                self.flush()
+            except Exception:
+                # The writer thread keeps going, the next save tries again
+                self.logger.exception("Saving the exobiology failed")
+
+    def set_interval(self, interval: int) -> None:
+        """Change the seconds between two saves, 0 to save every change right away."""
+        self.interval = interval
+        self.wakeup.set()
+
+    def stop(self) -> None:
+        """Stop the writer thread and save what is left."""
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush(force=True)
+        self.log.close()
+
+    # endregion
+
+    # region crawls
+
+    def hold(self) -> None:
+        """Save everything and stop saving, so a crawl can work on the saved stores."""
+        with self.lock:
+            self.held = True
+        self.flush(force=True)
+
+    def release(self) -> None:
+        """Take over the stores the crawl left behind and apply the changes since hold on top of them."""
+        with self.lock:
+            if not self.held:
+                return
+            # Everything that changed since hold is in the log, read applies it again
+            self.dirty = set()
+            self.dirtyshards = set()
+            self.records = []
+            self.read()
+            self.held = False
+        self.changed()
+
+    def switch(self, database: bool) -> None:
+        """Save the exobiology into the exobiology.db or back into the json files from now on."""
+        with self.savelock:
+            with self.lock:
+                # Everything gets saved, so every shard is needed
+                for index in range(self.shardcount):
+                    self.dirtyshards.add(index)
+                    self.shard(index)
+                self.database = database
+                self.dirty.update(["soldbiodata.json", "notsoldbiodata.json"])
+                if database:
+                    solddata = copy(biodataformat.merge(self.soldcmdrs, list(self.shards.values())))
+                    notsolddata = copy(self.notsolddata)
+                    # All of it goes into the database right away
+                    self.dirty = set()
+                    self.dirtyshards = set()
+                    self.records = []
+                    self.evict()
+            if database:
+                # Whatever is in there from an earlier time is outdated
+                connection = biodatabase.BiodataDatabase(os.path.join(self.directory, biodatabase.DATABASE_FILE))
+                try:
+                    connection.write(solddata, notsolddata, clear=True)
+                finally:
+                    connection.close()
+        self.flush(force=True)
+
+    # endregion
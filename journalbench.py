@@ -0,0 +1,328 @@
+"""
+Synthetic journal generator and benchmark for the journalcrawler.
+
+Writes journal folders that look like the ones of real exobiologists
+and times build_biodata_json on them.
+
+    python journalbench.py generate <journaldir> [--cmdrs 3 --files 100 ...]
+    python journalbench.py run <journaldir> [--workers 4]
+    python journalbench.py suite [--size small|medium|large]
+    python journalbench.py jsonbackends [--size small|medium|large]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from organicinfo import genusnamesjournaltolocal, getvistagenomicprices, organicnamesjournaltolocal
+
+# Events that are irrelevant for the crawler but make up most of real journals.
+noiseevents = ["Music", "ReceiveText", "ReservoirReplenished", "FSSSignalDiscovered",
+               "Scan", "FuelScoop", "NavBeaconScan", "ShipTargeted", "Friends", "SAASignalsFound"]
+
+# Sizes for the suite as keyword arguments for generate_journals.
+# large is well above 1M journal events.
+suitesizes = {
+    "small": {"cmdrs": 2, "files": 50, "events_per_file": 500},
+    "medium": {"cmdrs": 3, "files": 400, "events_per_file": 1000},
+    "large": {"cmdrs": 5, "files": 1200, "events_per_file": 1000},
+}
+
+
+def journalline(timestamp: datetime, event: str, **fields) -> str:
+    """Format a single journal line the way the game writes it."""
+    entry = {"timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"), "event": event}
+    entry.update(fields)
+    return "{ " + json.dumps(entry, separators=(", ", ":"))[1:-1] + " }\n"
+
+
+def systemname(rnd: random.Random) -> str:
+    """Return a procedurally generated or named system."""
+    if rnd.random() < 0.2:
+        return rnd.choice(["Futes", "Moriosong", "Colonia", "Sol", "Achenar", "Shinrarta Dezhra", "Ögmund"])
+    sector = rnd.choice(["Eol Prou", "Prua Phoe", "Blia Chraei", "Syreadiae", "Dryau Ausms", "Col 285 Sector"])
+    return (f"{sector} {rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}{rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}"
+            + f"-{rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')} d{rnd.randint(1, 99)}-{rnd.randint(1, 9999)}")
+
+
+def generate_journals(journaldir: str, cmdrs: int = 3, files: int = 100, events_per_file: int = 1000,  # noqa #CCR001
+                      scans_per_body: int = 3, by_system: float = 0.3, deaths: float = 0.05,
+                      seed: int = 0) -> int:
+    """
+    Write a folder of synthetic journal files and return the amount of journal events written.
+
+    :param cmdrs: amount of Commanders playing, each session picks one of them
+    :param files: amount of journal files (one per game session)
+    :param events_per_file: rough amount of events per journal file
+    :param scans_per_body: amount of species analysed on each body that is visited on foot
+    :param by_system: chance that a sale only sells the data of one system instead of the whole batch
+    :param deaths: chance per session that the Commander dies with unsold data
+    """
+    rnd = random.Random(seed)
+    os.makedirs(journaldir, exist_ok=True)
+
+    prices = getvistagenomicprices()
+    species = [name for name in organicnamesjournaltolocal.keys() if organicnamesjournaltolocal[name] in prices]
+    genera = {value: key for key, value in genusnamesjournaltolocal.items()}
+    commanders = [f"Synthetic {i}" for i in range(cmdrs)]
+    unsold = {cmdr: [] for cmdr in commanders}
+
+    timestamp = datetime(2022, 3, 15, 12, 0, 0)
+    total = 0
+
+    for _ in range(files):
+        timestamp += timedelta(hours=rnd.randint(2, 48))
+        filename = "Journal." + timestamp.strftime("%Y-%m-%dT%H%M%S") + ".01.log"
+        cmdr = rnd.choice(commanders)
+        system = systemname(rnd)
+        body = system
+        lines = []
+
+        def write(event, **fields):
+            nonlocal timestamp
+            timestamp += timedelta(seconds=rnd.randint(1, 30))
+            lines.append(journalline(timestamp, event, **fields))
+
+        write("Fileheader", part=1, language="English/UK", Odyssey=True, gameversion="4.0.0.1600")
+        write("Commander", FID="F" + str(commanders.index(cmdr)), Name=cmdr)
+        write("LoadGame", FID="F" + str(commanders.index(cmdr)), Commander=cmdr, Horizons=True, Odyssey=True)
+        write("Location", StarSystem=system, Body=body, BodyType="Star", Docked=False)
+
+        while len(lines) < events_per_file:
+            roll = rnd.random()
+            if roll < 0.95:
+                write(rnd.choice(noiseevents), Filler="x" * rnd.randint(10, 200))
+            elif roll < 0.98:
+                system = systemname(rnd)
+                body = system
+                write("FSDJump", StarSystem=system, Body=body, BodyType="Star", JumpDist=rnd.uniform(5, 60))
+            elif roll < 0.995:
+                # Land on a body and analyse a few species
+                body = f"{system} {rnd.randint(1, 9)} {rnd.choice('abcdef')}"
+                write("Touchdown", StarSystem=system, Body=body, Latitude=1.0, Longitude=2.0)
+                write("Disembark", StarSystem=system, Body=body, SRV=False, OnPlanet=True)
+                for name in rnd.sample(species, scans_per_body):
+                    localised = organicnamesjournaltolocal[name]
+                    genus = genera.get(localised.split(" ")[0], "$Codex_Ent_Stratum_Genus_Name;")
+                    for scantype in ["Log", "Sample", "Sample", "Analyse"]:
+                        write("ScanOrganic", ScanType=scantype, Genus=genus, Species=name.title(),
+                              SystemAddress=1, Body=3)
+                    unsold[cmdr].append((system, localised))
+                write("Embark", StarSystem=system, Body=body, SRV=False, OnPlanet=True)
+                write("Liftoff", StarSystem=system, Body=body, Latitude=1.0, Longitude=2.0)
+            elif unsold[cmdr] != []:
+                if rnd.random() < by_system:
+                    soldsystem = rnd.choice(unsold[cmdr])[0]
+                    sold = [data for data in unsold[cmdr] if data[0] == soldsystem]
+                    unsold[cmdr] = [data for data in unsold[cmdr] if data[0] != soldsystem]
+                else:
+                    sold = unsold[cmdr]
+                    unsold[cmdr] = []
+                biodata = [{"Genus": "$Codex_Ent_Stratum_Genus_Name;", "Species": "$Codex_Ent_Stratum_Name;",
+                            "Species_Localised": data[1], "Value": prices[data[1]], "Bonus": 0}
+                           for data in sold]
+                write("SellOrganicData", MarketID=rnd.randint(1, 99999), BioData=biodata)
+
+        if rnd.random() < deaths:
+            write("Died", KillerName="Skimmer")
+            write("Resurrect", Option="rebuy", Cost=1000, Bankrupt=False)
+            unsold[cmdr] = []
+
+        write("Shutdown")
+        with open(os.path.join(journaldir, filename), "w", encoding="utf8") as f:
+            f.writelines(lines)
+        total += len(lines)
+
+    return total
+
+
+def run_crawl(journaldir: str, workers: int = 1, outputdir: str = None, backend: str = None) -> dict:
+    """Time a single build_biodata_json run in this process and return the measurements."""
+    import biodataformat
+    import jsonbackend
+    from journalcrawler import build_biodata_json, close_archives, journal_bytes, journal_files, peak_rss
+
+    if backend is not None:
+        jsonbackend.use(backend)
+
+    logger = logging.getLogger("journalbench")
+    cleanup = outputdir is None
+    if cleanup:
+        outputdir = tempfile.mkdtemp(prefix="journalbench")
+
+    stats = {}
+    start = time.perf_counter()
+    unsoldvalue = build_biodata_json(logger, journaldir, workers=workers, outputdir=outputdir, stats=stats)
+    seconds = time.perf_counter() - start
+
+    try:
+        import resource
+        childpeak = peak_rss(resource.RUSAGE_CHILDREN)
+    except ImportError:
+        childpeak = None
+
+    events = stats["skipped"] + stats["decoded"]
+    # The same journals the crawler read, also from archives and with compressed ones at their full size
+    try:
+        bytes_read = sum(journal_bytes(journal) for journal in journal_files(journaldir))
+    finally:
+        close_archives()
+    result = {
+        "journaldir": journaldir,
+        "workers": workers,
+        "json_backend": jsonbackend.backend,
+        "seconds": round(seconds, 3),
+        "events": events,
+        "events_per_sec": round(events / seconds) if seconds > 0 else None,
+        "bytes_read": bytes_read,
+        "peak_rss": peak_rss(),
+        "peak_rss_workers": childpeak,
+        "output_size": sum(os.path.getsize(path) for f in ["soldbiodata.json", "notsoldbiodata.json"]
+                           for path in biodataformat.files(os.path.join(outputdir, f))),
+        "unsold_value": unsoldvalue,
+    }
+    result.update(stats)
+
+    if cleanup:
+        shutil.rmtree(outputdir, ignore_errors=True)
+    return result
+
+
+def run_isolated(journaldir: str, workers: int = 1, outputdir: str = None, backend: str = None) -> dict:
+    """Run a crawl in a fresh interpreter so that the peak memory is not polluted by earlier runs."""
+    command = [sys.executable, os.path.abspath(__file__), "run", journaldir, "--workers", str(workers), "--json"]
+    if outputdir is not None:
+        command += ["--outputdir", outputdir]
+    if backend is not None:
+        command += ["--json-backend", backend]
+    output = subprocess.run(command, check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def time_writes(storedir: str, rounds: int = 20) -> float:
+    """
+    Time reading, changing and rewriting the soldbiodata.json and notsoldbiodata.json like a scan or sale.
+
+    Every round reads, changes and rewrites both files in storedir with the JSON backend in use.
+    Return the seconds per round.
+    """
+    import biodataformat
+
+    item = {"species": "Stratum Tectonicas", "system": "Synthetic Write", "body": "Synthetic Write 1"}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        notsolddata = biodataformat.read(os.path.join(storedir, "notsoldbiodata.json"))
+        notsolddata.setdefault("Synthetic 0", []).append(item)
+        biodataformat.write(os.path.join(storedir, "notsoldbiodata.json"), notsolddata)
+        solddata = biodataformat.read(os.path.join(storedir, "soldbiodata.json"))
+        solddata.setdefault("Synthetic 0", {}).setdefault("s", {}).setdefault(item["system"], []).append(item)
+        biodataformat.write(os.path.join(storedir, "soldbiodata.json"), solddata)
+    return (time.perf_counter() - start) / rounds
+
+
+def compare_backends(journaldir: str, workers: int = 1) -> None:
+    """Print the speed of every JSON backend at crawling and at writing the resulting files."""
+    import jsonbackend
+
+    results = {}
+    for backend in jsonbackend.BACKENDS:
+        storedir = tempfile.mkdtemp(prefix="journalbench")
+        try:
+            crawl = run_isolated(journaldir, workers, storedir, backend)
+            jsonbackend.use(backend)
+            results[backend] = (crawl["seconds"], time_writes(storedir))
+        finally:
+            shutil.rmtree(storedir, ignore_errors=True)
+        print(f"{backend}: crawl {results[backend][0]:.3f} s,"
+              + f" write {results[backend][1] * 1000:.1f} ms per scan or sale")
+    slowest = results["json"]
+    for backend, (crawl, write) in results.items():
+        if backend != "json":
+            print(f"{backend} speedup over json: crawl {slowest[0] / crawl:.2f}x, write {slowest[1] / write:.2f}x")
+
+
+def print_result(result: dict) -> None:
+    """Print the measurements of a crawl in a human readable way."""
+    def mib(value):
+        return "n/a" if value is None else f"{value / 1048576:.1f} MiB"
+
+    print(f"{result['journaldir']} with {result['workers']} worker(s), {result['json_backend']} backend:")
+    print(f"    {result['events']:,} events in {result['seconds']} s -> {result['events_per_sec']:,} events/s")
+    print(f"    {mib(result['bytes_read'])} of journals, lines skipped: {result['skipped']:,},"
+          + f" decoded: {result['decoded']:,}")
+    print(f"    peak RSS: {mib(result['peak_rss'])} (workers: {mib(result['peak_rss_workers'])})")
+    print(f"    output size: {mib(result['output_size'])}, sold scans added: {result['added']:,}")
+
+
+def main(argv: list = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Synthetic journals and benchmarks for the journalcrawler.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic journal folder")
+    generate.add_argument("journaldir")
+    generate.add_argument("--cmdrs", type=int, default=3)
+    generate.add_argument("--files", type=int, default=100)
+    generate.add_argument("--events-per-file", type=int, default=1000)
+    generate.add_argument("--scans-per-body", type=int, default=3)
+    generate.add_argument("--by-system", type=float, default=0.3,
+                          help="chance that a sale only sells a single system")
+    generate.add_argument("--deaths", type=float, default=0.05, help="chance to die per session")
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("run", help="time the crawler on a journal folder")
+    run.add_argument("journaldir")
+    run.add_argument("--workers", type=int, default=1)
+    run.add_argument("--json", action="store_true", help="print the result as json")
+    run.add_argument("--outputdir", help="keep the soldbiodata.json and notsoldbiodata.json here")
+    run.add_argument("--json-backend", help="JSON backend to crawl with, see jsonbackend.BACKENDS")
+
+    suite = commands.add_parser("suite", help="generate a journal folder and time the crawler on it")
+    suite.add_argument("--size", choices=suitesizes.keys(), default="small")
+    suite.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                       help="worker count for the parallel run")
+
+    backends = commands.add_parser("jsonbackends", help="compare the JSON backends at crawling and writing")
+    backends.add_argument("--size", choices=suitesizes.keys(), default="small")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        events = generate_journals(args.journaldir, args.cmdrs, args.files, args.events_per_file,
+                                   args.scans_per_body, args.by_system, args.deaths, args.seed)
+        print(f"Wrote {events:,} events in {args.files} files to {args.journaldir}")
+    elif args.command == "run":
+        result = run_crawl(args.journaldir, args.workers, args.outputdir, args.json_backend)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_result(result)
+    elif args.command == "suite":
+        journaldir = tempfile.mkdtemp(prefix="journalbench")
+        try:
+            events = generate_journals(journaldir, **suitesizes[args.size])
+            print(f"Generated {events:,} events ({args.size})")
+            for workers in sorted({1, args.workers}):
+                print_result(run_isolated(journaldir, workers))
+        finally:
+            shutil.rmtree(journaldir, ignore_errors=True)
+    elif args.command == "jsonbackends":
+        journaldir = tempfile.mkdtemp(prefix="journalbench")
+        try:
+            events = generate_journals(journaldir, **suitesizes[args.size])
+            print(f"Generated {events:,} events ({args.size})")
+            compare_backends(journaldir)
+        finally:
+            shutil.rmtree(journaldir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,35 @@
 Here resides the journalcrawler that can read through all the journal files.
 
 It retraces all exobiology scans and sell actions.
+Run it on its own to crawl the journal folders or archives of many accounts at once:
+
+    python journalcrawler.py <journals>... -o <output folder> [-j 4] [-w 4] [--merge NAME] [--incremental]
+                             [--since 2023-01-31T12:00] [--until 2023-02-28]
 """
-import json
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import gzip
+import hashlib
+import heapq
+import itertools
+import logging
+import operator
 import os
+import re
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from typing import Optional
 
+import biodatabase
+import biodataformat
+import jsonbackend
 from organicinfo import generaltolocalised, getvistagenomicprices
 
 # This goes through a folder of journals that it'll parse
@@ -25,332 +50,1807 @@ from organicinfo import generaltolocalised, getvistagenomicprices
 
 alphabet = "abcdefghijklmnopqrstuvwxyz0123456789-"
 
+# Amount of newly sold scans kept in memory while crawling
+# before they are spilled to disk to keep the memory usage flat.
+FLUSH_SIZE = 5000
 
-def build_biodata_json(logger: any, journaldir: str) -> int:  # noqa #CCR001
-    """Build a soldbiodata.json and a notsoldbiodata that includes all sold organic scans that the player sold.
+# Shards of the sold exobiology (see biodataformat.py) whose sold scans are kept in memory while crawling
+KNOWN_SHARDS = 16
 
-    Also return the value of still unsold scans.
+# Checkpoints of incremental crawls, written next to the soldbiodata.json
+CHECKPOINT_FILE = "crawlcheckpoints.jsonl"
+
+# Amount of bytes at the start of a journal that are hashed to cheaply tell journals apart
+PREFIX_SIZE = 4096
+
+# Journal filenames hold the local time the game started writing them,
+# Journal.YYMMDDHHMMSS.NN.log in older versions of the game and Journal.YYYY-MM-DDTHHMMSS.NN.log now.
+oldjournalname = re.compile(r"Journal\.(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})\.\d+\.log")
+newjournalname = re.compile(r"Journal\.(\d{4})-(\d{2})-(\d{2})T(\d{2})(\d{2})(\d{2})\.\d+\.log")
+
+# The journal entries use UTC, so time windows are widened by the largest offset of a local time
+FILENAME_SLACK = timedelta(hours=14)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Digest of the relevant events of crawled journals, written next to the soldbiodata.json
+DIGEST_FILE = "journaldigest.jsonl"
+
+# Report of the last profiled crawl, written next to the soldbiodata.json
+PROFILE_FILE = "crawlprofile.json"
+
+# Amount of the slowest journals listed in the profile report
+SLOWEST_FILES = 10
+
+# The only journal events the crawler has to look at.
+# Every other line is skipped before it is decoded.
+RELEVANT_EVENTS = frozenset(["LoadGame", "Commander", "Location", "Embark",
+                             "Disembark", "Touchdown", "Liftoff", "FSDJump",
+                             "ScanOrganic", "Resurrect", "SellOrganicData"])
+relevantevents = frozenset(event.encode() for event in RELEVANT_EVENTS)
+
+
+def firstletterof(system: str) -> str:
+    """Return the first letter bucket a system is filed under in the soldbiodata.json."""
+    firstletter = system[0].lower()
+    if firstletter not in alphabet:
+        firstletter = "-"
+    return firstletter
+
+
+def event_name(line: bytes) -> Optional[bytes]:
+    """Return the event name of a raw journal line without decoding it, None for unusual formatting."""
+    start = line.find(b'"event":')
+    if start == -1:
+        return None
+    # Skip to the opening quote of the event name.
+    start = line.find(b'"', start + 8) + 1
+    return line[start:line.find(b'"', start)]
+
+
+def relevant_line(line: bytes) -> bool:
+    """Check the raw journal line for an event the crawler cares about without decoding it."""
+    event = event_name(line)
+    # Unusual formatting, let the json decoder figure it out.
+    return event is None or event in relevantevents
+
+
+# Archives that are kept open during a crawl as {path: ZipFile or TarFile}
+openarchives = {}
+
+tarextensions = (".tar", ".tar.gz", ".tgz")
+
+
+def archive(path: str):
+    """Return the opened zip or tar archive at path."""
+    # Worker processes inherit the archives opened before they were started,
+    # sharing the file position with this process, so they open their own.
+    key = (os.getpid(), path)
+    if key not in openarchives:
+        if path.endswith(".zip"):
+            openarchives[key] = zipfile.ZipFile(path)
+        else:
+            openarchives[key] = tarfile.open(path, "r:*")
+    return openarchives[key]
+
+
+def close_archives() -> None:
+    """Close all archives opened during the crawl."""
+    for key in list(openarchives.keys()):
+        if key[0] == os.getpid():
+            openarchives.pop(key).close()
+
+
+def archive_journals(path: str) -> list:
+    """List the journals inside of a zip or tar archive as (path, member)."""
+    if path.endswith(".zip"):
+        members = [member for member in archive(path).namelist() if member.endswith(".log")]
+    else:
+        members = [member.name for member in archive(path).getmembers()
+                   if member.isfile() and member.name.endswith(".log")]
+    return [(path, member) for member in members]
+
+
+def journal_files(journaldir: str) -> list:
     """
-    # logger.debug = print
+    List all journals in the journaldir as (path, member) ordered by their filename.
 
-    logger.debug("start logging")
+    Besides .log files these can be gzipped .log.gz files or members of .zip, .tar and .tar.gz archives
+    in the folder. The journaldir can also be a single archive.
+    member is None for journals that are not inside of a zip or tar archive.
+    """
+    if os.path.isfile(journaldir):
+        journals = archive_journals(journaldir)
+    else:
+        journals = []
+        with os.scandir(journaldir) as entries:
+            for entry in entries:
+                # checking if it is a file
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".log") or entry.name.endswith(".log.gz"):
+                    journals.append((entry.path, None))
+                elif entry.name.endswith(".zip") or entry.name.endswith(tarextensions):
+                    journals.extend(archive_journals(entry.path))
 
-    directory, sourcename = os.path.split(os.path.realpath(__file__))
+    # Order from os.scandir might depend on filesystem.
+    # Members of archives are sorted in between the other journals by their filename.
+    def filename(journal):
+        path, member = journal
+        if member is None:
+            member = os.path.basename(path)
+        return (os.path.basename(member).removesuffix(".gz"), path, member)
 
-    cmdr = ""
-    currentsystem = ""
-    currentbody = ""
+    journals.sort(key=filename)
+    return journals
 
-    totalcmdrlist = []
 
-    currententrytowrite = {}
+def journal_time(journal: tuple) -> str:
+    """Return the time in the filename of a journal like the timestamp of a journal entry, None for other names."""
+    path, member = journal
+    name = os.path.basename(path if member is None else member).removesuffix(".gz")
+    match = newjournalname.fullmatch(name)
+    if match is not None:
+        return "{}-{}-{}T{}:{}:{}Z".format(*match.groups())
+    match = oldjournalname.fullmatch(name)
+    if match is not None:
+        return "20{}-{}-{}T{}:{}:{}Z".format(*match.groups())
+    return None
 
-    logger.debug(directory)
 
-    sold_exobiology = {}
-    possibly_sold_data = {}
+def journal_index(journals: list) -> list:
+    """
+    Index journals from journal_files by the time in their filename as a sorted list of (time, journal).
 
-    if not os.path.exists(directory + "\\soldbiodata.json"):
-        f = open(directory + "\\soldbiodata.json", "w", encoding="utf8")
-        f.write(r"{}")
-        f.close()
+    Journals with other filenames can't be placed in time and are left out.
+    """
+    index = []
+    for journal in journals:
+        start = journal_time(journal)
+        if start is not None:
+            index.append((start, journal))
+    index.sort(key=operator.itemgetter(0))
+    return index
 
-    with open(directory + "\\soldbiodata.json", "r", encoding="utf8") as f:
-        sold_exobiology = json.load(f)
-        # logger.debug(sold_exobiology)
-        # logger.debug(len(sold_exobiology))
-        pass
 
-    edlogs = [f for f in os.listdir(journaldir) if f.endswith(".log")]
+def shift_timestamp(timestamp: str, delta: timedelta) -> str:
+    """Move a journal timestamp by delta."""
+    return (datetime.strptime(timestamp, TIMESTAMP_FORMAT) + delta).strftime(TIMESTAMP_FORMAT)
 
-    # Order from os.listdir might depend on filesystem.
 
-    edlogs.sort()
+def window_journals(index: list, since: str = None, until: str = None) -> tuple:
+    """
+    Split a journal_index into the journals before the time window after since up to until and the ones to crawl.
 
-    for filename in edlogs:
-        f = os.path.join(journaldir, filename)
-        logger.debug("Current file: " + f)
-        # checking if it is a file
-        if os.path.isfile(f):
-            file = open(f, "r", encoding="utf8")
-            lines = file.readlines()
-            for line in lines:
-                entry = json.loads(line)
+    The window is looked up by binary search. The journals to crawl start with the last journal
+    that was started before since, as it holds the first events of the window.
+    Return (before, window) as lists of journals in chronological order.
+    """
+    times = [start for start, journal in index]
+    journals = [journal for start, journal in index]
+    first = 0
+    end = len(journals)
+    if since is not None:
+        first = max(bisect.bisect_right(times, shift_timestamp(since, -FILENAME_SLACK)) - 1, 0)
+    if until is not None:
+        end = max(bisect.bisect_right(times, shift_timestamp(until, FILENAME_SLACK)), first)
+    return journals[:first], journals[first:end]
 
-                if entry["event"] in ["LoadGame", "Commander"]:
-                    # logger.debug("CMDR change event!")
-                    if entry["event"] == "Commander":
-                        cmdr = entry["Name"]
-                    else:
-                        cmdr = entry["Commander"]
 
-                    if cmdr != "" and cmdr is not None and cmdr not in totalcmdrlist:
-                        totalcmdrlist.append(cmdr)
+def last_location(journals: list, digest: any = None) -> list:
+    """
+    Find the last Commander and location in chronological journals, reading back from the newest one.
+
+    Journals in the JournalDigest digest are not read again.
+    Return the compact events that set them, to seed the state machine before crawling later journals.
+    """
+    cmdr = system = location = None
+    for journal in reversed(journals):
+        filecmdr = filesystem = filelocation = None
+        events = None
+        if digest is not None:
+            events = digest.cached(journal)
+        if events is None:
+            events = journal_events(journal)
+        for event in events:
+            if event[0] == "cmdr":
+                filecmdr = event
+            elif event[0] == "location":
+                filelocation = filesystem = event
+            elif event[0] == "system":
+                filesystem = event
+        cmdr = cmdr or filecmdr
+        system = system or filesystem
+        location = location or filelocation
+        if cmdr is not None and location is not None:
+            break
+    # A system without a body after the last location keeps its body
+    return [event for event in (cmdr, location, system) if event is not None]
+
+
+def journalname(journal: tuple) -> str:
+    """Return a readable name of a journal from journal_files."""
+    path, member = journal
+    if member is None:
+        return path
+    return path + "/" + member
+
+
+def open_journal(journal: tuple):
+    """Open a journal from journal_files in binary mode, decompressing it on the fly."""
+    path, member = journal
+    if member is None:
+        if path.endswith(".gz"):
+            return gzip.open(path, "rb")
+        return open(path, "rb")
+    if path.endswith(".zip"):
+        return archive(path).open(member)
+    return archive(path).extractfile(member)
+
+
+def read_journal(journal: tuple, stats: dict = None, offset: int = 0, profile: bool = False):  # noqa #CCR001
+    """
+    Lazily yield the relevant entries of a single journal one line at a time, starting at the byte offset.
+
+    Lines of events the crawler ignores are skipped before being decoded.
+    A last line that the game has not finished writing yet is left out.
+    If given, stats counts the "skipped" and "decoded" lines
+    and gets the byte "offset" up to which the journal was read and the amount of "bytes" read.
+    When read from the start it also gets the content "hash" of everything read.
+    With profile stats also gets the lines per event name as "events"
+    and the "readseconds" and "decodeseconds" spent in here.
+    """
+    skipped = 0
+    decoded = 0
+    start = offset
+    hasher = hashlib.blake2b(digest_size=16) if offset == 0 else None
+    if profile:
+        events = collections.Counter()
+        decodeseconds = 0.0
+        waited = 0.0
+        began = time.perf_counter()
+    with open_journal(journal) as file:
+        if offset:
+            file.seek(offset)
+        for line in file:
+            if not line.endswith(b"\n"):
+                try:
+                    jsonbackend.loads(line)
+                except ValueError:
+                    # The game is still writing this line.
+                    break
+            offset += len(line)
+            if hasher is not None:
+                hasher.update(line)
+            if profile:
+                events[event_name(line)] += 1
+            if not relevant_line(line):
+                skipped += 1
+                continue
+            decoded += 1
+            if profile:
+                clock = time.perf_counter()
+                entry = jsonbackend.loads(line)
+                paused = time.perf_counter()
+                decodeseconds += paused - clock
+                yield entry
+                waited += time.perf_counter() - paused
+                continue
+            yield jsonbackend.loads(line)
+    if stats is not None:
+        stats["skipped"] = stats.get("skipped", 0) + skipped
+        stats["decoded"] = stats.get("decoded", 0) + decoded
+        stats["offset"] = offset
+        stats["bytes"] = offset - start
+        if hasher is not None:
+            stats["hash"] = hasher.hexdigest()
+        if profile:
+            stats["events"] = {("unknown" if name is None else name.decode("utf8", "replace")): count
+                               for name, count in events.items()}
+            stats["decodeseconds"] = decodeseconds
+            stats["readseconds"] = time.perf_counter() - began - waited - decodeseconds
+
+
+def compact_event(entry: dict):
+    """
+    Reduce a decoded journal entry to the compact event tuple the crawl state machine replays.
+
+    Returns None for entries that don't change the state.
+    ("cmdr", name), ("location", system, body), ("system", system),
+    ("scan", species), ("death",) and ("sell", [species, ...])
+    """
+    event = entry["event"]
+    if event == "Commander":
+        return ("cmdr", entry["Name"])
+    if event == "LoadGame":
+        return ("cmdr", entry["Commander"])
+    if event in ["Location", "Embark", "Disembark", "Touchdown", "Liftoff", "FSDJump"]:
+        # Was playing in old Horizons so
+        # Touchdown and Liftoff don't have body nor system
+        if "StarSystem" not in entry:
+            return None
+        if "Body" not in entry:
+            return ("system", entry["StarSystem"])
+        return ("location", entry["StarSystem"], entry["Body"])
+    if event == "ScanOrganic":
+        if entry["ScanType"] == "Analyse":
+            return ("scan", generaltolocalised(entry["Species"].lower()))
+        return None
+    if event == "Resurrect":
+        return ("death",)
+    if event == "SellOrganicData":
+        return ("sell", [sold["Species_Localised"] for sold in entry["BioData"]])
+    return None
+
+
+def journal_events(journal: tuple, stats: dict = None, offset: int = 0, timed: bool = False, profile: bool = False):
+    """
+    Lazily yield the compact events of a single journal starting at the byte offset.
+
+    With timed they are yielded as (timestamp, event).
+    Entries without a timestamp get the one of the entry before them.
+    """
+    timestamp = ""
+    for entry in read_journal(journal, stats, offset, profile):
+        event = compact_event(entry)
+        if event is None:
+            continue
+        if timed:
+            timestamp = entry.get("timestamp", timestamp)
+            yield timestamp, event
+        else:
+            yield event
+
+
+def in_window(timestamp: str, event: tuple, since: str = None, until: str = None) -> bool:
+    """
+    Tell if a timed event counts for a crawl of the time window after since up to until.
+
+    Events before the window only count for the Commander and location, events after it not at all.
+    """
+    if until is not None and timestamp > until:
+        return False
+    if since is not None and timestamp <= since:
+        return event[0] in ("cmdr", "location", "system")
+    return True
+
 
-                    if cmdr != "" and cmdr is not None and cmdr not in sold_exobiology.keys():
-                        sold_exobiology[cmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
-                        logger.debug(sold_exobiology)
+def windowed_events(events, since: str = None, until: str = None, stats: dict = None):
+    """
+    Yield the compact events of timed events that count for the time window after since up to until.
+
+    If given, stats gets the timestamp of the "lastevent" in the window.
+    """
+    for timestamp, event in events:
+        if not in_window(timestamp, event, since, until):
+            continue
+        if stats is not None and timestamp > stats.get("lastevent", "") and (since is None or timestamp > since):
+            stats["lastevent"] = timestamp
+        yield event
+
+
+def parse_journal(journal: tuple, offset: int = 0, timed: bool = False, profile: bool = False) -> tuple:
+    """Parse a whole journal from the byte offset on into a list of compact events. Runs in the worker processes."""
+    stats = {}
+    events = list(journal_events(journal, stats, offset, timed, profile))
+    if profile:
+        stats["peakmemory"] = peak_rss()
+    return events, stats
 
-                    if cmdr != "" and cmdr not in possibly_sold_data.keys():
-                        possibly_sold_data[cmdr] = []
 
-                if entry["event"] in ["Location", "Embark",
-                                      "Disembark", "Touchdown",
-                                      "Liftoff", "FSDJump"]:
+def parsed_journals(journals: list, workers: int, timed: bool = False, profile: bool = False):
+    """
+    Yield (events, stats) for every (journal, offset) in the given order.
+
+    The journals are parsed by a pool of worker processes while
+    only a bounded amount of parsed journals is held back at any time.
+    Loose and gzipped journals and members of zip archives are decompressed in the workers.
+    tar archives can only be decompressed in one go, so their members are parsed here.
+    With a single worker the events are read lazily here instead
+    and the stats are complete once the events are consumed.
+    """
+    if workers == 1:
+        for journal, offset in journals:
+            stats = {}
+            yield journal_events(journal, stats, offset, timed, profile), stats
+        return
+
+    def submit(executor, job):
+        journal, offset = job
+        if journal[1] is not None and journal[0].endswith(tarextensions):
+            return job
+        return executor.submit(parse_journal, journal, offset, timed, profile)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        journals = iter(journals)
+        for journal in itertools.islice(journals, workers * 4):
+            pending.append(submit(executor, journal))
+        while pending:
+            job = pending.popleft()
+            if isinstance(job, concurrent.futures.Future):
+                result = job.result()
+            else:
+                result = parse_journal(*job, timed, profile)
+            for journal in itertools.islice(journals, 1):
+                pending.append(submit(executor, journal))
+            yield result
+
+
+def source_events(source: int, jobs: list, workers: int, profile: bool = False, digest: any = None):
+    """
+    Yield the events of the journals of one source as (timestamp, source, event, None).
+
+    jobs holds (index, (journal, offset, size, mtime)) in filename order.
+    After the last event of every journal (timestamp, source, None, (index, stats)) marks its end.
+    """
+    timestamp = ""
+    if digest is None:
+        parsed = parsed_journals([job[:2] for index, job in jobs], workers, True, profile)
+    else:
+        parsed = digest.journals([job for index, job in jobs], workers, True, profile)
+    for (index, job), (events, stats) in zip(jobs, parsed):
+        for timestamp, event in events:
+            yield timestamp, source, event, None
+        yield timestamp, source, None, (index, stats)
+
+
+def merged_events(sources: list, workers: int, profile: bool = False, digest: any = None):
+    """
+    Merge the events of several sources of journals into one chronological order.
+
+    sources holds the jobs of every source for source_events.
+    A heap merges the sources by timestamp while every source is streamed on its own,
+    so only the current journal of every source is held in memory.
+    Events of different sources with the same timestamp keep the order of the sources.
+    The workers are split up between the sources.
+    """
+    workers = max(1, workers // len(sources))
+    streams = [source_events(source, jobs, workers, profile, digest) for source, jobs in enumerate(sources)]
+    return heapq.merge(*streams, key=operator.itemgetter(0))
+
+
+class JournalDigest:
+    """
+    Compact digest of the crawled journals, so later crawls and catch-ups don't have to read them again.
+
+    Every line of the journaldigest.jsonl holds the compact events (see compact_event) with their timestamps
+    of a journal from byte "from" up to byte "offset", along with size and modification time of the journal.
+    Lines only ever get appended. A journal the game kept writing gets another line for its new part,
+    a journal that changed otherwise gets a line from byte 0 that replaces the ones before.
+    """
+
+    def __init__(self, outputdir: str) -> None:
+        """Load the digest in outputdir, compacting it when most of its lines got replaced."""
+        self.path = os.path.join(outputdir, DIGEST_FILE)
+        self.file = None
+        # {journalname: {"size", "mtime", "chunks": [(from, offset, events)] and the "hash" of the first chunk}}
+        self.entries = {}
+        lines = 0
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf8") as f:
+                for line in f:
                     try:
-                        currentsystem = entry["StarSystem"]
-                        currentbody = entry["Body"]
-                    except KeyError:
-                        # Was playing in old Horizons so
-                        # Touchdown and Liftoff don't have body nor system
-                        logger.debug("We've encountered a KeyError in the code "
-                                     + "for updating the current system and body.")
-                        logger.debug(entry)
-                if entry["event"] == "ScanOrganic":
-                    logger.debug("Scan organic Event!")
-                    if entry["ScanType"] in ["Sample", "Analyse"]:
-                        if entry["ScanType"] == "Analyse":
-                            currententrytowrite["species"] = generaltolocalised(entry["Species"].lower())
-                            currententrytowrite["system"] = currentsystem
-                            currententrytowrite["body"] = currentbody
-                            if currententrytowrite not in possibly_sold_data[cmdr]:
-                                possibly_sold_data[cmdr].append(currententrytowrite)
-                            currententrytowrite = {}
-                            continue
+                        chunk = jsonbackend.loads(line)
+                    except ValueError:
+                        # Cut off while it was written
+                        continue
+                    lines += 1
+                    self.take(chunk)
+        if lines > 2 * sum(len(entry["chunks"]) for entry in self.entries.values()):
+            self.compact()
+
+    def take(self, chunk: dict) -> bool:
+        """Add a line of the digest to the entries, return False if it doesn't continue what is known of the journal."""
+        name = chunk["journal"]
+        if chunk["from"] == 0:
+            self.entries[name] = {"chunks": [], "hash": chunk.get("hash")}
+        elif name not in self.entries.keys() or self.entries[name]["chunks"][-1][1] != chunk["from"]:
+            return False
+        entry = self.entries[name]
+        entry["size"] = chunk["size"]
+        entry["mtime"] = chunk["mtime"]
+        entry["chunks"].append((chunk["from"], chunk["offset"], chunk["events"]))
+        return True
+
+    def compact(self) -> None:
+        """Rewrite the digest with only the lines that are still in use."""
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf8") as f:
+            for name, entry in self.entries.items():
+                for start, offset, events in entry["chunks"]:
+                    chunk = {"journal": name, "from": start, "offset": offset,
+                             "size": entry["size"], "mtime": entry["mtime"], "events": events}
+                    if start == 0 and entry["hash"] is not None:
+                        chunk["hash"] = entry["hash"]
+                    f.write(jsonbackend.dumps(chunk) + "\n")
+        os.replace(temporary, self.path)
+
+    def plan(self, job: tuple) -> tuple:
+        """
+        Work out what the digest holds of a crawl job (journal, offset, size, mtime).
+
+        Return the timed events from the digest, the byte offset to read the rest of the journal from
+        (None if there is nothing left to read) and the stats of reading the events from the digest.
+        """
+        journal, offset, size, mtime = job
+        entry = self.entries.get(journalname(journal))
+        if entry is None or entry["chunks"] == []:
+            return [], offset, {}
+        chunks = entry["chunks"]
+        end = chunks[-1][1]
+        starts = [start for start, stop, events in chunks]
+        if offset in starts:
+            first = starts.index(offset)
+        elif offset == end:
+            first = len(chunks)
+        else:
+            return [], offset, {}
+
+        unchanged = entry["size"] == size and entry["mtime"] == mtime
+        grown = journal[1] is None and journal[0].endswith(".log") and size > entry["size"]
+        if not unchanged and not grown:
+            return [], offset, {}
+
+        events = [event for start, stop, chunkevents in chunks[first:] for event in chunkevents]
+        stats = {"offset": end, "digested": len(events)}
+        if offset == 0 and len(chunks) == 1 and entry["hash"] is not None:
+            stats["hash"] = entry["hash"]
+        if unchanged:
+            return events, None, stats
+        return events, end, stats
+
+    def cached(self, journal: tuple) -> list:
+        """Return the compact events of a whole journal if the digest is up to date with it, None otherwise."""
+        events, readfrom, stats = self.plan((journal, 0) + journal_stat(journal))
+        if readfrom is not None or stats == {}:
+            return None
+        return [event for timestamp, event in events]
+
+    def append(self, job: tuple, start: int, events: list, filestats: dict) -> None:
+        """Append the timed events of a journal read from byte start on to the digest."""
+        journal, offset, size, mtime = job
+        chunk = {"journal": journalname(journal), "from": start, "offset": filestats["offset"],
+                 "size": size, "mtime": mtime, "events": events}
+        if "hash" in filestats.keys():
+            chunk["hash"] = filestats["hash"]
+        if not self.take(chunk):
+            return
+        if self.file is None:
+            cutoff = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    cutoff = f.read(1) != b"\n"
+            self.file = open(self.path, "a", encoding="utf8")
+            if cutoff:
+                # Don't continue a line that was cut off
+                self.file.write("\n")
+        self.file.write(jsonbackend.dumps(chunk) + "\n")
+        self.file.flush()
+
+    def journals(self, jobs: list, workers: int, timed: bool = False, profile: bool = False):
+        """
+        Yield (events, stats) for every crawl job (journal, offset, size, mtime) like parsed_journals.
+
+        Only the parts of the journals that are not in the digest yet are read and get appended to it.
+        stats counts the events taken from the digest as "digested".
+        """
+        plans = [self.plan(job) for job in jobs]
+        parsed = parsed_journals([(job[0], readfrom) for job, (events, readfrom, stats) in zip(jobs, plans)
+                                  if readfrom is not None], workers, True, profile)
+        for job, (events, readfrom, stats) in zip(jobs, plans):
+            if readfrom is not None:
+                newevents, filestats = next(parsed)
+                newevents = list(newevents)
+                self.append(job, readfrom, newevents, filestats)
+                filestats["digested"] = len(events)
+                events = events + newevents
+                stats = filestats
+            if not timed:
+                events = [event for timestamp, event in events]
+            yield events, stats
+
+    def close(self) -> None:
+        """Close the digest file if anything was appended."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class CrawlCancelled(Exception):
+    """Raised by build_biodata_json when the crawl got cancelled before it was done."""
+
+
+def peak_rss(who: int = None) -> int:
+    """Return the peak resident set size in bytes of this process (or its children), None if unknown."""
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    if who is None:
+        who = resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+class CrawlProfile:
+    """
+    Collects where the time of a crawl goes for the profile report of build_biodata_json.
+
+    Reading and decoding are timed where the journals are read,
+    with workers that is the time of all worker processes added up.
+    """
+
+    def __init__(self) -> None:
+        """Start the clock of the crawl."""
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(["listing", "load", "reading", "decoding", "state", "merge", "save"], 0.0)
+        self.events = collections.Counter()
+        self.files = []
+        self.workerpeak = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Add the time spent in the with block to a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def timed(self, name: str, function: callable) -> callable:
+        """Wrap function to add the time spent in it to a phase."""
+        phases = self.phases
+
+        def wrapper(*args):
+            start = time.perf_counter()
+            result = function(*args)
+            phases[name] += time.perf_counter() - start
+            return result
+        return wrapper
+
+    def add_journal(self, journal: tuple, filestats: dict) -> None:
+        """Take over the profile stats of a journal that was read."""
+        seconds = filestats.get("readseconds", 0) + filestats.get("decodeseconds", 0)
+        self.phases["reading"] += filestats.get("readseconds", 0)
+        self.phases["decoding"] += filestats.get("decodeseconds", 0)
+        self.events.update(filestats.get("events", {}))
+        self.files.append({"journal": journalname(journal), "bytes": filestats.get("bytes", 0),
+                           "seconds": round(seconds, 6)})
+        if filestats.get("peakmemory") is not None:
+            self.workerpeak = max(self.workerpeak or 0, filestats["peakmemory"])
+
+    def report(self, stats: dict) -> dict:
+        """Return the profile report of the crawl with its stats."""
+        return {
+            "seconds": round(time.perf_counter() - self.start, 6),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "events": dict(self.events.most_common()),
+            "peakmemory": peak_rss(),
+            "workerpeakmemory": self.workerpeak,
+            "slowest": sorted(self.files, key=operator.itemgetter("seconds"), reverse=True)[:SLOWEST_FILES],
+            "files": self.files,
+            "stats": stats,
+        }
+
+
+class CrawlState:
+    """
+    State machine that retraces Commander, location, scans and sells through journal entries.
+
+    Newly sold scans are collected per Commander and spilled
+    to a temporary file every flushsize scans.
+    The sold scans known from before are looked up by the shard of their system,
+    only the keys of the KNOWN_SHARDS shards used last are kept in memory.
+    """
+
+    def __init__(self, logger: any, soldshards: any, flushsize: int = FLUSH_SIZE) -> None:
+        """Initialize the state with the already known sold exobiology, a SoldShards."""
+        self.logger = logger
+        self.flushsize = flushsize
+
+        self.cmdr = ""
+        self.currentsystem = ""
+        self.currentbody = ""
+
+        # Commander and location of the other sources when crawling several sources at once
+        self.source = 0
+        self.sources = {}
+
+        self.totalcmdrlist = []
+
+        self.possibly_sold_data = {}
+        # Keys of the scans in possibly_sold_data as (system, body, species)
+        self.pendingkeys = {}
+
+        self.soldshards = soldshards
+        # Keys of the known sold exobiology per shard, the least recently used first (see known_shard)
+        self.known = collections.OrderedDict()
+        # Systems that got an entry in a letter of the sold exobiology in this crawl as (letter, system)
+        self.soldsystems = {}
+        # Keys of the scans sold in this crawl as (system, body, species)
+        self.solditems = {}
+
+        # Newly sold exobiology that was not yet spilled to disk
+        self.sold_exobiology = {}
+        self.unflushed = 0
+        self.spill = None
+
+    def seed_unsold(self, notsolddata: dict) -> None:
+        """Start out from the unsold scans in the content of a notsoldbiodata.json."""
+        for cmdr, unsold in notsolddata.items():
+            if cmdr not in self.totalcmdrlist:
+                self.totalcmdrlist.append(cmdr)
+            self.possibly_sold_data.setdefault(cmdr, [])
+            self.pendingkeys.setdefault(cmdr, set())
+            for data in unsold:
+                key = (data["system"], data["body"], data["species"])
+                if key not in self.pendingkeys[cmdr]:
+                    self.pendingkeys[cmdr].add(key)
+                    self.possibly_sold_data[cmdr].append({"species": data["species"], "system": data["system"],
+                                                          "body": data["body"]})
+
+    def switch(self, source: int) -> None:
+        """Continue with the Commander and location of another source of journals, e.g. another machine."""
+        self.sources[self.source] = (self.cmdr, self.currentsystem, self.currentbody)
+        self.cmdr, self.currentsystem, self.currentbody = self.sources.get(source, ("", "", ""))
+        self.source = source
+
+    def apply(self, event: tuple) -> None:  # noqa #CCR001
+        """Advance the state machine by a single compact event (see compact_event)."""
+        kind = event[0]
+
+        if kind == "cmdr":
+            cmdr = event[1]
+            self.cmdr = cmdr
+
+            if cmdr != "" and cmdr is not None and cmdr not in self.totalcmdrlist:
+                self.totalcmdrlist.append(cmdr)
+
+            if cmdr != "" and cmdr not in self.possibly_sold_data.keys():
+                self.possibly_sold_data[cmdr] = []
+                self.pendingkeys[cmdr] = set()
+
+        elif kind == "location":
+            self.currentsystem = event[1]
+            self.currentbody = event[2]
+
+        elif kind == "system":
+            self.currentsystem = event[1]
+
+        elif kind == "scan":
+            currententrytowrite = {}
+            currententrytowrite["species"] = event[1]
+            currententrytowrite["system"] = self.currentsystem
+            currententrytowrite["body"] = self.currentbody
+            key = (self.currentsystem, self.currentbody, event[1])
+            if key not in self.pendingkeys[self.cmdr]:
+                self.pendingkeys[self.cmdr].add(key)
+                self.possibly_sold_data[self.cmdr].append(currententrytowrite)
+
+        elif kind == "death":
+            # Reset - player was unable to sell before death
+            self.possibly_sold_data[self.cmdr] = []
+            self.pendingkeys[self.cmdr] = set()
+
+        elif kind == "sell":
+            self.sell(event[1])
+
+    def sell(self, soldspecies: list) -> None:  # noqa #CCR001
+        """Attribute the species sold in a SellOrganicData event to the scans that were sold."""
+        logger = self.logger
+        cmdr = self.cmdr
+        possibly_sold_data = self.possibly_sold_data
+
+        currentbatch = {}
+        # Lets create a more human readable list of different types
+        # of sold biodata to see how we can continue from there.
+        for species in soldspecies:
+            if species in currentbatch.keys():
+                currentbatch[species] += 1
+            else:
+                currentbatch[species] = 1
+        bysystem = {}
+        for biodata in possibly_sold_data[cmdr]:
+            if biodata["system"] in bysystem.keys():
+                if (biodata["species"] in bysystem[biodata["system"]].keys()):
+                    bysystem[biodata["system"]][biodata["species"]] += 1
+                else:
+                    bysystem[biodata["system"]][biodata["species"]] = 1
+            else:
+                bysystem[biodata["system"]] = {}
+                bysystem[biodata["system"]][biodata["species"]] = 1
+        soldbysystempossible = {}
+
+        # Get every system
+        for system in bysystem:
+            # and we assume every system to be the one that was possibly sold from
+            soldbysystempossible[system] = True
+            for species in currentbatch:
+                if species not in bysystem[system].keys():
+                    # Species that we are selling does not appear in its bysystem structure
+                    # so it cant be the system that we sold from
+                    soldbysystempossible[system] = False
+                    # since we found out the system can't be the one we sold we break here
+                    # and continue with the next system
+                    break
+                if soldbysystempossible[system] is False:
+                    continue
+                # Checking if we have any systems that have too few of a certain species
+                if bysystem[system][species] < currentbatch[species]:
+                    soldbysystempossible[system] = False
+                    break
 
-                if entry["event"] == "Resurrect":
-                    # Reset - player was unable to sell before death
-                    logger.debug("We died")
-                    possibly_sold_data[cmdr] = []
-
-                if entry["event"] == "SellOrganicData":
-                    logger.debug("SellOrganicData event!")
-                    currentbatch = {}
-                    # Lets create a more human readable list of different types
-                    # of sold biodata to see how we can continue from there.
-                    for sold in entry["BioData"]:
-                        if sold["Species_Localised"] in currentbatch.keys():
-                            currentbatch[sold["Species_Localised"]] += 1
-                        else:
-                            currentbatch[sold["Species_Localised"]] = 1
-                    bysystem = {}
-                    for biodata in possibly_sold_data[cmdr]:
-                        if biodata["system"] in bysystem.keys():
-                            if (biodata["species"] in bysystem[biodata["system"]].keys()):
-                                bysystem[biodata["system"]][biodata["species"]] += 1
-                            else:
-                                bysystem[biodata["system"]][biodata["species"]] = 1
-                        else:
-                            bysystem[biodata["system"]] = {}
-                            bysystem[biodata["system"]][biodata["species"]] = 1
-                    soldbysystempossible = {}
-                    logger.debug("bysystem:")
-                    logger.debug(bysystem)
-                    logger.debug("Currentbatch:")
-                    logger.debug(currentbatch)
-                    # input()
-
-                    # Get every system
-                    for system in bysystem:
-                        # and we assume every system to be the one that was possibly sold from
-                        soldbysystempossible[system] = True
-                        for species in currentbatch:
-                            if species not in bysystem[system].keys():
-                                # Species that we are selling does not appear in its bysystem structure
-                                # so it cant be the system that we sold from
-                                soldbysystempossible[system] = False
-                                # since we found out the system can't be the one we sold we break here
-                                # and continue with the next system
-                                break
-                            if soldbysystempossible[system] is False:
-                                continue
-                            # Checking if we have any systems that have too few of a certain species
-                            if bysystem[system][species] < currentbatch[species]:
-                                soldbysystempossible[system] = False
-                                break
-
-                    # this is still not perfect because it cannot be.
-                    # if the player sells the data by system and 2 systems
-                    # have the same amount of the same species then no one
-                    # can tell which system was actually sold at
-                    # vista genomics.
-                    # In described case whatever is the first system we
-                    # encounter through iteration will be chosen as the
-                    # system that was sold.
-                    thesystem = ""
-                    for system in soldbysystempossible:
-                        if soldbysystempossible[system] is True:
-                            # We always take the first system that is possible
-                            # If there are two we cannot tell which one was
-                            # sold. Though it should not really matter
-                            # as long as the CMDR hasn't died right
-                            # after without selling the data aswell.
-                            thesystem = system
-                            break
-
-                    # An eligible system was found and we selected the first
-                    if thesystem != "":
-                        logger.debug("CMDR sold by system: " + thesystem)
-                        i = 0
-                        while i < len(possibly_sold_data[cmdr]):
-                            # For the case when we are done when we havent sold everything
-                            done = True
-                            for species in currentbatch:
-                                if currentbatch[species] != 0:
-                                    done = False
-                            if done:
-                                break
-
-                            logger.debug(" i = " + str(i))
-
-                            firstletter = possibly_sold_data[cmdr][i]["system"][0].lower()
-                            if firstletter not in alphabet:
-                                firstletter = "-"
-                            # Checking here more granularily
-                            # which data was sold.
-                            # We do know though that
-                            # the specifc data was sold only
-                            # in one system that at this point
-                            # is saved in the variable "thesystem"
-                            logger.debug("possibly sold data")
-                            logger.debug(possibly_sold_data[cmdr])
-                            logger.debug("current batch")
-                            logger.debug(currentbatch)
-
-                            if (thesystem not in sold_exobiology[cmdr][firstletter].keys()
-                               and (thesystem[0].lower() == firstletter or firstletter == "-")):
-                                sold_exobiology[cmdr][firstletter][thesystem] = []
-
-                            check = (possibly_sold_data[cmdr][i]["system"] == thesystem
-                                     and possibly_sold_data[cmdr][i]
-                                     not in sold_exobiology[cmdr][firstletter][thesystem]
-                                     and possibly_sold_data[cmdr][i]["species"] in currentbatch.keys())
-                            if check:
-                                if currentbatch[possibly_sold_data[cmdr][i]["species"]] > 0:
-                                    logger.debug("We append in specific system")
-                                    sold_exobiology[cmdr][firstletter][thesystem].append(possibly_sold_data[cmdr][i])
-                                    currentbatch[possibly_sold_data[cmdr][i]["species"]] -= 1
-                                    thing = possibly_sold_data[cmdr].pop(i)
-                                    logger.debug("Sold:")
-                                    logger.debug(thing)
-                                    logger.debug(" i = " + str(i))
-                                    continue
-                                else:
-                                    logger.error("currentbatch has negative amount for some species"
-                                                 + " this is a problem")
-                            i += 1
+        # this is still not perfect because it cannot be.
+        # if the player sells the data by system and 2 systems
+        # have the same amount of the same species then no one
+        # can tell which system was actually sold at
+        # vista genomics.
+        # In described case whatever is the first system we
+        # encounter through iteration will be chosen as the
+        # system that was sold.
+        thesystem = ""
+        for system in soldbysystempossible:
+            if soldbysystempossible[system] is True:
+                # We always take the first system that is possible
+                # If there are two we cannot tell which one was
+                # sold. Though it should not really matter
+                # as long as the CMDR hasn't died right
+                # after without selling the data aswell.
+                thesystem = system
+                break
+
+        # An eligible system was found and we selected the first
+        if thesystem != "":
+            # Scans that stay unsold, collected instead of popping
+            # the sold ones out of the middle of the list.
+            unsold = []
+            left = len(soldspecies)
+            for i, data in enumerate(possibly_sold_data[cmdr]):
+                # For the case when we are done when we havent sold everything
+                if left == 0:
+                    unsold.extend(possibly_sold_data[cmdr][i:])
+                    break
+
+                firstletter = firstletterof(data["system"])
+                # Checking here more granularily
+                # which data was sold.
+                # We do know though that
+                # the specifc data was sold only
+                # in one system that at this point
+                # is saved in the variable "thesystem"
+
+                if (thesystem[0].lower() == firstletter or firstletter == "-"):
+                    self.add_system(cmdr, firstletter, thesystem)
+
+                key = (data["system"], data["body"], data["species"])
+                check = (data["system"] == thesystem
+                         and data["species"] in currentbatch.keys()
+                         and not self.is_sold(cmdr, key))
+                if check:
+                    if currentbatch[data["species"]] > 0:
+                        self.add_sold(cmdr, firstletter, data)
+                        currentbatch[data["species"]] -= 1
+                        left -= 1
+                        self.pendingkeys[cmdr].discard(key)
+                        continue
                     else:
-                        logger.debug("CMDR sold the whole batch.")
-                        logger.debug("possibly sold data")
-                        logger.debug(possibly_sold_data[cmdr])
-                        logger.debug("current batch")
-                        logger.debug(currentbatch)
+                        logger.error("currentbatch has negative amount for some species"
+                                     + " this is a problem")
+                unsold.append(data)
+            possibly_sold_data[cmdr] = unsold
+        else:
+            for data in possibly_sold_data[cmdr]:
+                firstletter = firstletterof(data["system"])
+
+                self.add_system(cmdr, firstletter, data["system"])
+
+                if data["species"] not in currentbatch.keys():
+                    continue
+
+                if (currentbatch[data["species"]] > 0
+                   and not self.is_sold(cmdr, (data["system"], data["body"], data["species"]))):
+                    currentbatch[data["species"]] -= 1
+                    self.add_sold(cmdr, firstletter, data)
+            possibly_sold_data[cmdr] = []
+            self.pendingkeys[cmdr] = set()
+
+        if self.unflushed >= self.flushsize:
+            self.flush()
+
+    def known_shard(self, system: str) -> dict:
+        """Return {cmdr: ((letter, system) keys, (system, body, species) keys)} of the shard of system."""
+        index = biodataformat.shard_of(system, self.soldshards.count)
+        if index in self.known.keys():
+            self.known.move_to_end(index)
+            return self.known[index]
+        keys = {}
+        for cmdr, cmdrdata in self.soldshards.read(index).items():
+            systems = set()
+            items = set()
+            for letter in cmdrdata:
+                for name in cmdrdata[letter]:
+                    systems.add((letter, name))
+                    for item in cmdrdata[letter][name]:
+                        items.add((item["system"], item["body"], item["species"]))
+            keys[cmdr] = (systems, items)
+        self.known[index] = keys
+        if len(self.known) > KNOWN_SHARDS:
+            self.known.popitem(last=False)
+        return keys
+
+    def is_sold(self, cmdr: str, key: tuple) -> bool:
+        """Tell if the scan with the key (system, body, species) of cmdr was sold before."""
+        if key in self.solditems.get(cmdr, ()):
+            return True
+        return key in self.known_shard(key[0]).get(cmdr, ((), ()))[1]
+
+    def add_system(self, cmdr: str, letter: str, system: str) -> None:
+        """Make sure there is an entry for the system in the given letter of the sold exobiology."""
+        if (letter, system) in self.soldsystems.get(cmdr, ()):
+            return
+        self.soldsystems.setdefault(cmdr, set()).add((letter, system))
+        if (letter, system) in self.known_shard(system).get(cmdr, ((), ()))[0]:
+            return
+        self.sold_exobiology.setdefault(cmdr, {}).setdefault(letter, {}).setdefault(system, [])
+
+    def add_sold(self, cmdr: str, letter: str, data: dict) -> None:
+        """Record a single scan as sold."""
+        self.solditems.setdefault(cmdr, set()).add((data["system"], data["body"], data["species"]))
+        self.sold_exobiology.setdefault(cmdr, {}).setdefault(letter, {}).setdefault(data["system"], []).append(data)
+        self.unflushed += 1
+
+    def flush(self) -> None:
+        """Spill the newly sold exobiology collected so far to a temporary file."""
+        if self.sold_exobiology == {}:
+            return
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile("w+", encoding="utf8")
+        self.spill.write(jsonbackend.dumps(self.sold_exobiology) + "\n")
+        self.sold_exobiology = {}
+        self.unflushed = 0
+
+    def snapshot(self) -> dict:
+        """Return the state of the Commander, location and unsold scans as a json serialisable dict."""
+        return {
+            "cmdr": self.cmdr,
+            "system": self.currentsystem,
+            "body": self.currentbody,
+            "cmdrs": self.totalcmdrlist.copy(),
+            "unsold": {cmdr: [[data["system"], data["body"], data["species"]] for data in unsold]
+                       for cmdr, unsold in self.possibly_sold_data.items()},
+        }
+
+    def restore(self, snapshot: dict) -> None:
+        """Continue from a state returned by snapshot, taking over the Commanders in it."""
+        self.cmdr = snapshot["cmdr"]
+        self.currentsystem = snapshot["system"]
+        self.currentbody = snapshot["body"]
+        for cmdr in snapshot["cmdrs"]:
+            if cmdr not in self.totalcmdrlist:
+                self.totalcmdrlist.append(cmdr)
+        # Commanders only known to this crawl keep their unsold scans
+        for cmdr, unsold in snapshot["unsold"].items():
+            self.possibly_sold_data[cmdr] = [{"species": species, "system": system, "body": body}
+                                             for system, body, species in unsold]
+            self.pendingkeys[cmdr] = set((system, body, species) for system, body, species in unsold)
+
+    def chunks(self):
+        """Yield all chunks of newly sold exobiology in the order they were found and close the spill."""
+        if self.spill is not None:
+            self.spill.seek(0)
+            for line in self.spill:
+                yield jsonbackend.loads(line)
+            self.spill.close()
+            self.spill = None
+        if self.sold_exobiology != {}:
+            yield self.sold_exobiology
+        self.sold_exobiology = {}
+        self.unflushed = 0
+
+
+def load_checkpoints(outputdir: str) -> dict:
+    """
+    Load the checkpoints of earlier crawls as {journalname: checkpoint}.
+
+    Checkpoints written after the last finished crawl are ignored,
+    their results never made it into the soldbiodata.json.
+    """
+    file = os.path.join(outputdir, CHECKPOINT_FILE)
+    checkpoints = {}
+    if not os.path.exists(file):
+        return checkpoints
+    uncommitted = {}
+    lines = 0
+    with open(file, "r", encoding="utf8") as f:
+        for line in f:
+            lines += 1
+            try:
+                checkpoint = jsonbackend.loads(line)
+            except ValueError:
+                # Crawl got interrupted while writing
+                break
+            if "commit" in checkpoint.keys():
+                checkpoints.update(uncommitted)
+                uncommitted = {}
+            elif "begin" in checkpoint.keys():
+                # Whatever came before was from a crawl that never finished
+                uncommitted = {}
+            else:
+                uncommitted[checkpoint["journal"]] = checkpoint
+    if lines > 2 * len(checkpoints) + 100:
+        # Drop outdated checkpoints of the same journals
+        with open(file + ".tmp", "w", encoding="utf8") as f:
+            for checkpoint in checkpoints.values():
+                f.write(jsonbackend.dumps(checkpoint) + "\n")
+            f.write(jsonbackend.dumps({"commit": True}) + "\n")
+        os.replace(file + ".tmp", file)
+    return checkpoints
+
+
+def journal_bytes(journal: tuple) -> int:
+    """Return the size of a journal itself, for compressed journals the uncompressed size."""
+    path, member = journal
+    if member is None:
+        if path.endswith(".gz"):
+            # gzip keeps the uncompressed size in its last four bytes
+            with open(path, "rb") as f:
+                f.seek(-4, os.SEEK_END)
+                return int.from_bytes(f.read(4), "little")
+        return os.path.getsize(path)
+    if path.endswith(".zip"):
+        return archive(path).getinfo(member).file_size
+    return archive(path).getmember(member).size
+
+
+def journal_prefix(journal: tuple) -> str:
+    """Return the hash of the first PREFIX_SIZE bytes of a journal."""
+    with open_journal(journal) as file:
+        return hashlib.blake2b(file.read(PREFIX_SIZE), digest_size=16).hexdigest()
+
+
+def journal_hash(journal: tuple) -> str:
+    """Return the hash of the whole content of a journal, the same read_journal puts into its stats."""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open_journal(journal) as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def duplicate_journals(jobs: list, checkpoints: dict) -> tuple:
+    """
+    Find the journals to crawl that were crawled before, no matter under which path or name.
+
+    Journals are told apart by their size and the hash of their start first,
+    their whole content is only hashed when both match an earlier journal.
+    Return the prefix hash of every job and {job index: (checkpoint, hash)} of the duplicates,
+    with the checkpoint of the earlier crawl, or None for copies of a journal crawled before in this crawl.
+    """
+    known = {}
+    for checkpoint in checkpoints.values():
+        if "hash" in checkpoint.keys():
+            known.setdefault((checkpoint["offset"], checkpoint["prefix"]), []).append(checkpoint)
+
+    prefixes = []
+    duplicates = {}
+    hashes = {}
+    seen = {}
+    for i, job in enumerate(jobs):
+        journal, offset = job[:2]
+        if offset != 0:
+            prefixes.append(None)
+            continue
+        prefix = journal_prefix(journal)
+        prefixes.append(prefix)
+        key = (journal_bytes(journal), prefix)
+        candidates = known.get(key, [])
+        earlier = seen.setdefault(key, [])
+        if candidates != [] or earlier != []:
+            hashes[i] = journal_hash(journal)
+            for checkpoint in candidates:
+                if checkpoint["hash"] == hashes[i]:
+                    duplicates[i] = (checkpoint, hashes[i])
+                    break
+            for j in earlier:
+                if j not in hashes.keys():
+                    hashes[j] = journal_hash(jobs[j][0])
+                if i not in duplicates.keys() and hashes[j] == hashes[i]:
+                    duplicates[i] = (None, hashes[i])
+        if i not in duplicates.keys():
+            earlier.append(i)
+    return prefixes, duplicates
+
+
+def journal_stat(journal: tuple) -> tuple:
+    """Return size and modification time of the file a journal is stored in."""
+    stat = os.stat(journal[0])
+    return stat.st_size, stat.st_mtime_ns
 
-                        for data in possibly_sold_data[cmdr]:
-                            firstletter = data["system"][0].lower()
-                            if firstletter not in alphabet:
-                                firstletter = "-"
 
-                            if (data["system"] not in sold_exobiology[cmdr][firstletter].keys()
-                               and (data["system"][0].lower() == firstletter or firstletter == "-")):
-                                sold_exobiology[cmdr][firstletter][data["system"]] = []
+def crawl_jobs(journals: list, checkpoints: dict) -> tuple:
+    """
+    Work out which journals have to be crawled again using the checkpoints of earlier crawls.
 
-                            if data["species"] not in currentbatch.keys():
-                                continue
+    Unchanged journals at the start are skipped, a loose journal that grew
+    is continued where the last crawl stopped reading it.
+    Return the state to continue from (or None) and a list of (journal, offset, size, mtime).
+    """
+    seed = None
+    start = 0
+    offset = 0
+    for i, journal in enumerate(journals):
+        checkpoint = checkpoints.get(journalname(journal))
+        if checkpoint is None:
+            break
+        size, mtime = journal_stat(journal)
+        if checkpoint["size"] == size and checkpoint["mtime"] == mtime:
+            seed = checkpoint["state"]
+            start = i + 1
+            continue
+        if journal[1] is None and journal[0].endswith(".log") and size > checkpoint["size"]:
+            # The game kept writing into the journal
+            seed = checkpoint["state"]
+            offset = checkpoint["offset"]
+        start = i
+        break
 
-                            if (data not in sold_exobiology[cmdr][firstletter][data["system"]]
-                               and currentbatch[data["species"]] > 0):
-                                currentbatch[data["species"]] -= 1
+    jobs = []
+    for journal in journals[start:]:
+        jobs.append((journal, offset) + journal_stat(journal))
+        offset = 0
+    return seed, jobs
 
-                                logger.debug("We append single bit of whole batch")
-                                sold_exobiology[cmdr][firstletter][data["system"]].append(data)
-                                logger.debug("We appended single bit of whole batch")
-                        possibly_sold_data[cmdr] = []
 
-            file.close()
+def build_sold_index(solddata: dict, cmdrs: list) -> dict:
+    """Build a set of (letter, system, body, species) of the sold scans in the soldbiodata.json per Commander."""
+    soldindex = {}
+    for cmdr in cmdrs:
+        soldindex[cmdr] = set()
+        if cmdr not in solddata.keys():
+            continue
+        for letter in solddata[cmdr]:
+            for system in solddata[cmdr][letter]:
+                for item in solddata[cmdr][letter][system]:
+                    soldindex[cmdr].add((letter, system, item["body"], item["species"]))
+    return soldindex
 
-    logger.debug("Saving file now")
 
-    solddata = None
+def merge_sold_data(solddata: dict, soldindex: dict, chunks, totalcmdrlist: list) -> tuple:
+    """
+    Merge chunks of newly sold exobiology into the content of the soldbiodata.json.
 
-    with open(directory + "\\soldbiodata.json", "r+", encoding="utf8") as f:
-        solddata = json.load(f)
+    Scans with a body and species already logged for the system are skipped.
+    Return the amount of added scans and of skipped duplicates.
+    """
+    added = 0
+    duplicates = 0
 
+    for sold_exobiology in chunks:
         for currentcmdr in totalcmdrlist:
+            if currentcmdr not in sold_exobiology.keys():
+                continue
             if currentcmdr not in solddata.keys():
                 solddata[currentcmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
-            if sold_exobiology[currentcmdr] != []:
-                for letter in sold_exobiology[currentcmdr].keys():
-                    for system in sold_exobiology[currentcmdr][letter]:
-                        if system not in solddata[currentcmdr][letter].keys():
-                            solddata[currentcmdr][letter][system] = []
-                        for item in sold_exobiology[currentcmdr][letter][system]:
-                            alreadylogged = False
-                            for loggeditem in solddata[currentcmdr][letter][system]:
-                                if loggeditem["body"] == item["body"]:
-                                    if loggeditem["species"] == item["species"]:
-                                        alreadylogged = True
-                                        continue
-                            if not alreadylogged:
-                                solddata[currentcmdr][letter][system].append(item)
-                sold_exobiology[currentcmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
-        f.seek(0)
-        json.dump(solddata, f, indent=4)
-        f.truncate()
-
-    notsolddata = None
-
-    with open(directory + "\\notsoldbiodata.json", "r+", encoding="utf8") as f:
-        notsolddata = json.load(f)
-        for currentcmdr in totalcmdrlist:
-            if currentcmdr not in notsolddata.keys():
-                notsolddata[currentcmdr] = []
-            if len(notsolddata[currentcmdr]) > 0:
-                possibly_sold_data[currentcmdr].extend(notsolddata[currentcmdr])
-                notsolddata[currentcmdr] = []
-            for element in possibly_sold_data[currentcmdr]:
-                try:
-                    if element in solddata[currentcmdr][element["system"][0].lower()][element["system"]]:
-                        continue
-                except KeyError:
-                    # Yay KeyError this means the element is not in there! woo
-                    pass
-                if element not in notsolddata[currentcmdr]:
-                    notsolddata[currentcmdr].append(element)
-        f.seek(0)
-        json.dump(notsolddata, f, indent=4)
-        f.truncate()
+            for letter in sold_exobiology[currentcmdr].keys():
+                for system in sold_exobiology[currentcmdr][letter]:
+                    if system not in solddata[currentcmdr][letter].keys():
+                        solddata[currentcmdr][letter][system] = []
+                    for item in sold_exobiology[currentcmdr][letter][system]:
+                        key = (letter, system, item["body"], item["species"])
+                        if key in soldindex[currentcmdr]:
+                            duplicates += 1
+                            continue
+                        soldindex[currentcmdr].add(key)
+                        solddata[currentcmdr][letter][system].append(item)
+                        added += 1
+
+    return added, duplicates
+
+
+def merge_sold_shards(soldshards: any, chunks, totalcmdrlist: list, unsoldsystems: set) -> tuple:
+    """
+    Merge chunks of newly sold exobiology into a SoldShards one shard at a time.
+
+    The chunks are sorted into a temporary file per shard first, then every shard with newly sold scans
+    is read, merged by merge_sold_data and written again. Shards without any are left alone.
+    Return the amount of added scans and of skipped duplicates and the sold index (see build_sold_index)
+    of the systems in unsoldsystems, which is all merge_notsold_data needs.
+    """
+    added = 0
+    duplicates = 0
+    soldindex = {cmdr: set() for cmdr in totalcmdrlist}
+    groups = {}
+    try:
+        for sold_exobiology in chunks:
+            for index, part in biodataformat.split(sold_exobiology, soldshards.count).items():
+                if part == {}:
+                    continue
+                if index not in groups.keys():
+                    groups[index] = tempfile.TemporaryFile("w+", encoding="utf8")
+                groups[index].write(jsonbackend.dumps(part) + "\n")
+
+        needed = set(groups.keys())
+        needed.update(biodataformat.shard_of(system, soldshards.count) for system in unsoldsystems)
+        for index in sorted(needed):
+            solddata = soldshards.read(index)
+            if index in groups.keys():
+                groups[index].seek(0)
+                counts = merge_sold_data(solddata, build_sold_index(solddata, totalcmdrlist),
+                                         (jsonbackend.loads(line) for line in groups[index]), totalcmdrlist)
+                added += counts[0]
+                duplicates += counts[1]
+                soldshards.write(index, solddata)
+            for cmdr in totalcmdrlist:
+                for letter, bucket in solddata.get(cmdr, {}).items():
+                    for system in unsoldsystems.intersection(bucket.keys()):
+                        for item in bucket[system]:
+                            soldindex[cmdr].add((letter, system, item["body"], item["species"]))
+    finally:
+        for group in groups.values():
+            group.close()
+    soldshards.add_cmdrs(totalcmdrlist)
+    return added, duplicates, soldindex
+
+
+def merge_notsold_data(notsolddata: dict, soldindex: dict, possibly_sold_data: dict, totalcmdrlist: list,
+                       replace: bool = False) -> int:
+    """
+    Rebuild the content of the notsoldbiodata.json from the still unsold scans of the crawl.
+
+    Scans that are in the sold data by now are dropped.
+    With replace the crawl started out from the unsold scans (see CrawlState.seed_unsold),
+    so they are replaced by the ones of the crawl instead of being added to them.
+    Return the amount of scans that moved from unsold to sold.
+    """
+    moved = 0
+
+    for currentcmdr in totalcmdrlist:
+        if currentcmdr not in notsolddata.keys():
+            notsolddata[currentcmdr] = []
+        crawled = len(possibly_sold_data[currentcmdr])
+        if replace:
+            for element in notsolddata[currentcmdr]:
+                key = (element["system"][0].lower(), element["system"], element["body"], element["species"])
+                if key in soldindex[currentcmdr]:
+                    moved += 1
+            notsolddata[currentcmdr] = []
+        elif len(notsolddata[currentcmdr]) > 0:
+            possibly_sold_data[currentcmdr].extend(notsolddata[currentcmdr])
+            notsolddata[currentcmdr] = []
+        unsoldkeys = set()
+        for i, element in enumerate(possibly_sold_data[currentcmdr]):
+            # Sold scans are filed under the lowercase first letter of their system here
+            key = (element["system"][0].lower(), element["system"], element["body"], element["species"])
+            if key in soldindex[currentcmdr]:
+                if i >= crawled:
+                    moved += 1
+                continue
+            if key not in unsoldkeys:
+                unsoldkeys.add(key)
+                notsolddata[currentcmdr].append(element)
+
+    return moved
+
+
+class SoldShards:
+    """
+    The sold exobiology in an output folder or its exobiology.db, read and written a shard at a time.
+
+    See biodataformat.py for the shards, a crawl never has to hold all of the sold exobiology in memory.
+    """
+
+    def __init__(self, outputdir: str, database: bool = False) -> None:
+        """Open the sold exobiology in outputdir, a soldbiodata.json in the plain layout is split up into shards."""
+        self.outputdir = outputdir
+        self.path = os.path.join(outputdir, "soldbiodata.json")
+        self.database = database
+        self.count = biodataformat.SHARDS
+        if database:
+            db = biodatabase.open_database(outputdir)
+            try:
+                self.cmdrs = db.sold_cmdrs()
+            finally:
+                db.close()
+            return
+        with open(self.path, "r", encoding="utf8") as f:
+            data = jsonbackend.load(f)
+        if not biodataformat.is_sharded(data):
+            # Only a soldbiodata.json of the last release is ever read in one go, to split it up
+            data = biodataformat.decode(data)
+            biodataformat.write(self.path, data)
+            data = biodataformat.manifest(data.keys())
+        self.count = data["shards"]
+        self.cmdrs = data["cmdrs"]
+
+    def read(self, index: int) -> dict:
+        """Return the sold exobiology of a shard in the plain layout."""
+        if not self.database:
+            return biodataformat.read_shard(self.path, index)
+        db = biodatabase.BiodataDatabase(os.path.join(self.outputdir, biodatabase.DATABASE_FILE))
+        try:
+            return db.read_sold_shard(index)
+        finally:
+            db.close()
+
+    def write(self, index: int, solddata: dict) -> None:
+        """Replace the sold exobiology of a shard with solddata in the plain layout."""
+        if not self.database:
+            os.makedirs(os.path.splitext(self.path)[0], exist_ok=True)
+            biodataformat.write_file(biodataformat.shard_path(self.path, index), biodataformat.dumps_shard(solddata))
+            return
+        db = biodatabase.BiodataDatabase(os.path.join(self.outputdir, biodatabase.DATABASE_FILE))
+        try:
+            db.write_sold_shard(index, solddata)
+        finally:
+            db.close()
+
+    def add_cmdrs(self, cmdrs: list) -> None:
+        """Give cmdrs an entry in the sold exobiology, once their shards are written."""
+        self.cmdrs = self.cmdrs + [cmdr for cmdr in cmdrs if cmdr not in self.cmdrs]
+        if not self.database:
+            biodataformat.write_file(self.path, jsonbackend.dumps(biodataformat.manifest(self.cmdrs, self.count)))
+            return
+        db = biodatabase.BiodataDatabase(os.path.join(self.outputdir, biodatabase.DATABASE_FILE))
+        try:
+            db.add_sold_cmdrs(cmdrs)
+        finally:
+            db.close()
+
+
+def load_store(outputdir: str, file: str, database: bool = False) -> dict:
+    """Return the content of the soldbiodata.json or notsoldbiodata.json in outputdir, or of its exobiology.db."""
+    if not database:
+        return biodataformat.read(os.path.join(outputdir, file))
+    db = biodatabase.open_database(outputdir)
+    try:
+        return db.read_sold() if file == "soldbiodata.json" else db.read_unsold()
+    finally:
+        db.close()
+
+
+def save_unsold(outputdir: str, notsolddata: dict, cmdrs: list, database: bool = False) -> None:
+    """Save the merged unsold exobiology of cmdrs into outputdir or its exobiology.db."""
+    if not database:
+        biodataformat.write(os.path.join(outputdir, "notsoldbiodata.json"), notsolddata)
+        return
+    db = biodatabase.open_database(outputdir)
+    try:
+        db.write(notsolddata=notsolddata, cmdrs=cmdrs)
+    finally:
+        db.close()
+
 
+def unsold_value(notsolddata: dict) -> int:
+    """Return the value of all unsold scans in the content of the notsoldbiodata.json."""
     unsoldvalue = 0
 
     vistagenomicsprices = getvistagenomicprices()
 
     for cmdr in notsolddata.keys():
         for element in notsolddata[cmdr]:
-            print(element)
             unsoldvalue += vistagenomicsprices[element["species"]]
 
-    logger.debug("Done with journalcrawling!")
-
     return unsoldvalue
 
 
-# to use it as standalone
-"""
-class loggingthing:
-    def __init__(self):
-        self.info = print
-        self.debug = print
-        self.warning = print
-        self.error = print
-        pass
+def build_biodata_json(logger: any, journaldir: any, flushsize: int = FLUSH_SIZE,  # noqa #CCR001
+                       workers: int = 1, outputdir: str = None, stats: dict = None,
+                       checkpoint: bool = False, progress: callable = None, cancel: any = None,
+                       since: str = None, until: str = None, profile: bool = False, digest: bool = False,
+                       database: bool = False) -> int:
+    """Build a soldbiodata.json and a notsoldbiodata that includes all sold organic scans that the player sold.
+
+    Journals are read lazily one line at a time and newly sold scans are spilled
+    to disk every flushsize scans, so the memory usage does not grow with the amount of journals.
+
+    With workers other than 1 the journal files are parsed in parallel by that many
+    worker processes (None for one per CPU core) and replayed in filename order afterwards.
+    Don't use this from within EDMC itself, as worker processes would start another EDMC.
+
+    journaldir can also be a list of folders and archives, e.g. from several machines.
+    Their events are merged into one chronological order by their timestamps
+    and every one of them keeps track of its own Commander and location.
+    Crawls of several folders can't use checkpoints.
+
+    since and until (journal timestamps like "2023-01-31T12:00:00Z") limit the crawl to a time window,
+    e.g. to catch up on a session that EDMC missed. Events before since only set the Commander
+    and location and the crawl starts out from the scans in the notsoldbiodata.json instead.
+    Only the journals with a start time in their filename that falls into the window are read,
+    the Commander and location at its start are taken from the last journals before it.
+    Events after until are ignored.
+    stats gets the timestamp of the "lastevent" in the window. Crawls of a time window can't use checkpoints.
+
+    The soldbiodata.json and notsoldbiodata.json are in outputdir, by default next to this file.
+    The sold exobiology is only read and written a shard at a time (see SoldShards and merge_sold_shards),
+    the only exception being a soldbiodata.json of the last release that still has to be split up.
+    If given, stats gets filled with the line, byte and scan counts of the crawl.
+
+    With checkpoint a checkpoint is written after every journal into the crawlcheckpoints.jsonl in outputdir.
+    It holds size and modification time of the journal and the state at its end.
+    Later crawls with checkpoint only crawl new journals and the new part of journals the game kept writing.
+    Journals with the same content as one crawled before are skipped no matter their path or name.
+    Copies of journals from earlier crawls are only recognised with checkpoint, as their hashes are kept there.
+    When nothing was crawled yet the state is taken over from the checkpoint of the earlier copy,
+    otherwise the current state is kept and only the events of the copy are skipped.
+
+    progress gets called after every journal with a dict of the "files" and "bytes" done so far,
+    the "totalfiles" and "totalbytes" to do, the "events" read and the "seconds" passed.
+    Once cancel (a threading.Event) is set the crawl stops after the current journal
+    and raises CrawlCancelled without touching the soldbiodata.json and notsoldbiodata.json.
+
+    With digest the relevant events of every journal read are kept in the journaldigest.jsonl in outputdir
+    and later crawls with digest take the events of journals that didn't change from there
+    instead of reading them again. Unlike checkpoints this works for every crawl, including time windows.
+
+    With profile a report of the crawl is written as crawlprofile.json into outputdir.
+    It holds the seconds spent per phase (listing, load, reading, decoding, state, merge and save),
+    the lines per journal event, the bytes and seconds of every journal read, the slowest journals,
+    the peak memory of this process and the worker processes (None on Windows) and the stats.
+
+    With database the sold and unsold exobiology are kept in the exobiology.db in outputdir (see biodatabase.py)
+    instead of the json files. Only the shards with newly sold scans and the unsold rows of the Commanders of the crawl
+    get replaced.
+
+    Also return the value of still unsold scans.
+    """
+    profiler = CrawlProfile()
+
+    if isinstance(journaldir, str):
+        journaldirs = [journaldir]
+    else:
+        journaldirs = list(journaldir)
+
+    timed = since is not None or until is not None
+
+    if checkpoint and (len(journaldirs) > 1 or timed):
+        logger.warning("Checkpoints only work when crawling all of a single journal folder, crawling without them")
+        checkpoint = False
+
+    if outputdir is None:
+        outputdir, sourcename = os.path.split(os.path.realpath(__file__))
+
+    logger.debug(f"Crawling {', '.join(journaldirs)} into {outputdir}")
+
+    if not database:
+        for file in ["soldbiodata.json", "notsoldbiodata.json"]:
+            if not os.path.exists(os.path.join(outputdir, file)):
+                f = open(os.path.join(outputdir, file), "w", encoding="utf8")
+                f.write(r"{}")
+                f.close()
+
+    with profiler.phase("load"):
+        soldshards = SoldShards(outputdir, database)
+        state = CrawlState(logger, soldshards, flushsize)
+
+        if since is not None:
+            state.seed_unsold(load_store(outputdir, "notsoldbiodata.json", database))
+
+        checkpoints = {}
+        checkpointfile = None
+        if checkpoint:
+            if soldshards.cmdrs == []:
+                # Starting from scratch, the old checkpoints are meaningless.
+                if os.path.exists(os.path.join(outputdir, CHECKPOINT_FILE)):
+                    os.remove(os.path.join(outputdir, CHECKPOINT_FILE))
+            else:
+                checkpoints = load_checkpoints(outputdir)
+
+        journaldigest = JournalDigest(outputdir) if digest else None
+
+    if stats is None:
+        stats = {}
+    stats["skipped"] = 0
+    stats["decoded"] = 0
+    stats["bytes"] = 0
+    stats["duplicatefiles"] = 0
+    stats["duplicatebytes"] = 0
+    stats["digested"] = 0
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    done = {"files": 0, "bytes": 0, "totalfiles": 0, "totalbytes": 0, "events": 0, "seconds": 0}
+    start = time.perf_counter()
+
+    # Timing every event is only worth it for the profile
+    apply = profiler.timed("state", state.apply) if profile else state.apply
+
+    def finished(job, filestats, prefix):
+        stats["skipped"] += filestats.get("skipped", 0)
+        stats["decoded"] += filestats.get("decoded", 0)
+        stats["bytes"] += filestats.get("bytes", 0)
+        stats["digested"] += filestats.get("digested", 0)
+        if profile and "bytes" in filestats.keys():
+            profiler.add_journal(job[0], filestats)
+        if checkpointfile is not None:
+            journal, offset, size, mtime = job
+            line = {"journal": journalname(journal), "size": size, "mtime": mtime,
+                    "offset": filestats["offset"], "state": state.snapshot()}
+            if "hash" in filestats.keys():
+                line["prefix"] = prefix
+                line["hash"] = filestats["hash"]
+            checkpointfile.write(jsonbackend.dumps(line) + "\n")
+            checkpointfile.flush()
+        if progress is not None:
+            done["files"] += 1
+            done["bytes"] += filestats.get("offset", 0) - job[1]
+            done["events"] = stats["skipped"] + stats["decoded"]
+            done["seconds"] = time.perf_counter() - start
+            progress(done.copy())
+        if cancel is not None and cancel.is_set():
+            raise CrawlCancelled()
+
+    try:
+        with profiler.phase("listing"):
+            sources = [journal_files(directory) for directory in journaldirs]
+            if timed:
+                # Only the journals of the window are crawled, found by the times in their filenames.
+                # The Commander and location at its start come from the journals before it.
+                windows = [window_journals(journal_index(journals), since, until) for journals in sources]
+                for source, (before, journals) in enumerate(windows):
+                    state.switch(source)
+                    for event in last_location(before, journaldigest):
+                        state.apply(event)
+                state.switch(0)
+                sources = [journals for before, journals in windows]
+            edlogs = [journal for journals in sources for journal in journals]
+
+            seed, jobs = crawl_jobs(edlogs, checkpoints)
+            if seed is not None:
+                state.restore(seed)
+            prefixes, duplicates = duplicate_journals(jobs, checkpoints)
+            logger.info(f"Journals to crawl: {len(jobs) - len(duplicates)} of {len(edlogs)}")
+
+            if progress is not None:
+                done["totalfiles"] = len(jobs)
+                done["totalbytes"] = sum(journal_bytes(job[0]) - job[1] for job in jobs)
+                progress(done.copy())
+
+        if checkpoint:
+            checkpointfile = open(os.path.join(outputdir, CHECKPOINT_FILE), "a", encoding="utf8")
+            checkpointfile.write(jsonbackend.dumps({"begin": True}) + "\n")
+
+        # Only until the first journal is crawled the state of an earlier copy is the state to continue from,
+        # later on it would throw away the Commander, location and unsold scans of the journals crawled since.
+        fresh = [seed is None]
+
+        def skipped(i):
+            earlier, contenthash = duplicates[i]
+            size = journal_bytes(jobs[i][0])
+            if earlier is not None and fresh[0]:
+                state.restore(earlier["state"])
+            stats["duplicatefiles"] += 1
+            stats["duplicatebytes"] += size
+            finished(jobs[i], {"offset": size, "hash": contenthash}, prefixes[i])
+
+        if len(sources) == 1:
+            # With workers the journals are parsed in worker processes
+            # and the state machine replays them here in filename order.
+            if journaldigest is None:
+                parsed = parsed_journals([job[:2] for i, job in enumerate(jobs) if i not in duplicates.keys()],
+                                         workers, timed, profile)
+            else:
+                parsed = journaldigest.journals([job for i, job in enumerate(jobs) if i not in duplicates.keys()],
+                                                workers, timed, profile)
+
+            for i, job in enumerate(jobs):
+                if i in duplicates.keys():
+                    skipped(i)
+                    continue
+                events, filestats = next(parsed)
+                if timed:
+                    events = windowed_events(events, since, until, stats)
+                for event in events:
+                    apply(event)
+                fresh[0] = False
+                finished(job, filestats, prefixes[i])
+        else:
+            # Without checkpoints the jobs are all journals of all sources in order
+            sourcejobs = []
+            i = 0
+            for journals in sources:
+                sourcejobs.append([(j, jobs[j]) for j in range(i, i + len(journals)) if j not in duplicates.keys()])
+                i += len(journals)
+            for i in duplicates.keys():
+                skipped(i)
+
+            for timestamp, source, event, end in merged_events(sourcejobs, workers, profile, journaldigest):
+                if source != state.source:
+                    state.switch(source)
+                if event is not None:
+                    if timed:
+                        if not in_window(timestamp, event, since, until):
+                            continue
+                        if timestamp > stats.get("lastevent", "") and (since is None or timestamp > since):
+                            stats["lastevent"] = timestamp
+                    apply(event)
+                    continue
+                i, filestats = end
+                finished(jobs[i], filestats, prefixes[i])
+    finally:
+        close_archives()
+        if checkpointfile is not None:
+            checkpointfile.close()
+        if journaldigest is not None:
+            journaldigest.close()
+
+    logger.info(f"Journal lines skipped: {stats['skipped']}, decoded: {stats['decoded']}, "
+                + f"events taken from the digest: {stats['digested']}")
+    logger.info(f"Journals skipped as crawled before: {stats['duplicatefiles']} "
+                + f"({stats['duplicatebytes']:,} bytes)")
+
+    def saveprofile():
+        with open(os.path.join(outputdir, PROFILE_FILE), "w", encoding="utf8") as f:
+            jsonbackend.dump(profiler.report(stats), f, indent=True)
+
+    if (checkpoint or since is not None) and jobs == []:
+        # Nothing new since the last crawl, the files are up to date.
+        notsolddata = load_store(outputdir, "notsoldbiodata.json", database)
+        stats["added"] = stats["duplicates"] = stats["moved"] = 0
+        if profile:
+            saveprofile()
+        return unsold_value(notsolddata)
+
+    totalcmdrlist = state.totalcmdrlist
+
+    with profiler.phase("load"):
+        notsolddata = load_store(outputdir, "notsoldbiodata.json", database)
+    with profiler.phase("merge"):
+        # Only the sold scans of systems with unsold scans matter for those
+        unsoldsystems = set(item["system"] for cmdr in totalcmdrlist
+                            for item in state.possibly_sold_data[cmdr] + notsolddata.get(cmdr, []))
+        added, duplicates, soldindex = merge_sold_shards(soldshards, state.chunks(), totalcmdrlist, unsoldsystems)
+        moved = merge_notsold_data(notsolddata, soldindex, state.possibly_sold_data, totalcmdrlist,
+                                   replace=since is not None)
+
+    with profiler.phase("save"):
+        save_unsold(outputdir, notsolddata, totalcmdrlist, database)
+
+    logger.info(f"Sold scans added: {added}, skipped as duplicates: {duplicates}, "
+                + f"moved from unsold to sold: {moved}")
+
+    stats["added"] = added
+    stats["duplicates"] = duplicates
+    stats["moved"] = moved
+
+    if checkpoint:
+        # The results are saved, from now on the checkpoints are valid.
+        with open(os.path.join(outputdir, CHECKPOINT_FILE), "a", encoding="utf8") as f:
+            f.write(jsonbackend.dumps({"commit": True}) + "\n")
+
+    if profile:
+        saveprofile()
+
+    return unsold_value(notsolddata)
+
+
+def crawl_account(job: tuple) -> dict:
+    """
+    Crawl the journals of a single account into its own output folder and time it.
+
+    job is (name, journaldirs, outputdir, options) with the options for build_biodata_json.
+    Runs in the worker processes of the command line.
+    """
+    name, journaldirs, outputdir, options = job
+    os.makedirs(outputdir, exist_ok=True)
+    stats = {}
+    start = time.perf_counter()
+    unsoldvalue = build_biodata_json(logging.getLogger(f"journalcrawler.{name}"), journaldirs,
+                                     outputdir=outputdir, stats=stats, **options)
+    stats["seconds"] = time.perf_counter() - start
+    stats["unsold"] = unsoldvalue
+    stats["name"] = name
+    return stats
+
+
+def account_names(inputs: list) -> list:
+    """Name the account of every input folder or archive after it, numbering names that come up more than once."""
+    names = []
+    for path in inputs:
+        name = os.path.basename(os.path.normpath(path))
+        for extension in (".zip",) + tarextensions:
+            name = name.removesuffix(extension)
+        unique = name
+        count = 1
+        while unique in names:
+            count += 1
+            unique = f"{name}-{count}"
+        names.append(unique)
+    return names
+
+
+def window_time(text: str) -> str:
+    """Turn a date or UTC time from the command line like 2023-01-31 or 2023-01-31T12:00 into a journal timestamp."""
+    text = text.removesuffix("Z")
+    for form in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, form).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"{text} is not a date like 2023-01-31 or a UTC time like 2023-01-31T12:00:00")
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line to crawl the journals of many accounts at once, without EDMC.
+
+    Every input folder or archive is an account of its own that gets its own
+    soldbiodata.json and notsoldbiodata.json in a folder named after it in the output folder.
+    The accounts are crawled in parallel, one per worker process.
+    Each of them can parse its journals in worker processes of its own as well.
+    """
+    parser = argparse.ArgumentParser(description="Crawl journal folders and archives for sold and unsold exobiology.")
+    parser.add_argument("inputs", nargs="+", help="journal folders or .zip/.tar/.tar.gz archives, one per account")
+    parser.add_argument("-o", "--output", required=True,
+                        help="folder to write the soldbiodata.json and notsoldbiodata.json of every account into")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="amount of accounts crawled in parallel (default: one per CPU core)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="worker processes parsing the journals of each account (default: 1), "
+                        + "e.g. for a single large account or --merge")
+    parser.add_argument("--merge", metavar="NAME",
+                        help="crawl all inputs as a single account NAME, merging them by time")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep checkpoints to only crawl new journals next time, also needed "
+                        + "to skip copies of journals crawled in an earlier run")
+    parser.add_argument("--since", type=window_time,
+                        help="only crawl the events after this UTC time, e.g. the last carrier trip")
+    parser.add_argument("--until", type=window_time, help="only crawl the events up to this UTC time")
+    parser.add_argument("--flush-size", type=int, default=FLUSH_SIZE,
+                        help="sold scans kept in memory before spilling them to disk")
+    parser.add_argument("--digest", action="store_true",
+                        help="keep a digest of the relevant journal events to only read new journals next time")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a crawlprofile.json with the time spent per phase "
+                        + "next to the output of every account")
+    parser.add_argument("--sqlite", action="store_true",
+                        help="keep the sold and unsold exobiology in an exobiology.db instead of the json files")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every journal")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(name)s: %(message)s")
+
+    options = {"flushsize": args.flush_size, "workers": args.workers, "checkpoint": args.incremental,
+               "since": args.since, "until": args.until, "profile": args.profile, "digest": args.digest,
+               "database": args.sqlite}
+    if args.merge is not None:
+        jobs = [(args.merge, args.inputs, os.path.join(args.output, args.merge), options)]
+    else:
+        jobs = [(name, path, os.path.join(args.output, name), options)
+                for name, path in zip(account_names(args.inputs), args.inputs)]
+
+    failed = 0
+    results = []
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(jobs)))) as executor:
+        futures = {executor.submit(crawl_account, job): job[0] for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{futures[future]}: failed: {e!r}", file=sys.stderr)
+                continue
+            results.append(stats)
+            events = stats["skipped"] + stats["decoded"]
+            print(f"{stats['name']}: {events:,} events, {stats['bytes'] / 1048576:.1f} MiB"
+                  + f" in {stats['seconds']:.2f} s ({events / max(stats['seconds'], 1e-9):,.0f} events/s),"
+                  + f" {stats['added']:,} sold scans added, {stats['unsold']:,} Cr. unsold")
+    seconds = time.perf_counter() - start
+
+    events = sum(stats["skipped"] + stats["decoded"] for stats in results)
+    size = sum(stats["bytes"] for stats in results)
+    print(f"Crawled {len(results)} of {len(jobs)} accounts: {events:,} events, {size / 1048576:.1f} MiB"
+          + f" in {seconds:.2f} s -> {events / max(seconds, 1e-9):,.0f} events/s,"
+          + f" {size / 1048576 / max(seconds, 1e-9):.1f} MiB/s")
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    logger = loggingthing()
-    directory, sourcename = os.path.split(os.path.realpath(__file__))
-    journaldir = directory + "\\journals\\"
-    build_biodata_json(logger, journaldir)
-    journaldir = "<Path>"
-    build_biodata_json(logger, journaldir)
-"""
+    sys.exit(main())
@@ -0,0 +1,372 @@
+"""
+Differential replay of journals through the journalcrawler and through the live event handlers of load.py.
+
+Which scans got sold is worked out twice, by build_biodata_json and by journal_entry in load.py.
+This feeds the same journals through both, with EDMC and tkinter stubbed out,
+diffs the resulting soldbiodata.json and notsoldbiodata.json and times both per event.
+
+    python journalreplay.py <journaldir> [--files 20] [--json] [--keep]
+
+Exits with 1 if the results differ.
+"""
+import argparse
+import collections
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import types
+
+import biodatabase
+import biodataformat
+import jsonbackend
+from journalcrawler import build_biodata_json, journal_files, journalname, open_journal, unsold_value
+
+
+class StubVariable:
+    """Stand-in for the tkinter variables, it just holds the value."""
+
+    default = ""
+
+    def __init__(self, master=None, value=None, name=None) -> None:
+        """Hold value like tkinter would."""
+        self.value = self.default if value is None else value
+
+    def get(self):
+        """Return the value."""
+        return self.value
+
+    def set(self, value) -> None:
+        """Change the value."""
+        self.value = value
+
+
+class StubIntVar(StubVariable):
+    """Stand-in for tk.IntVar."""
+
+    default = 0
+
+    def get(self) -> int:
+        """Return the value as int like tkinter does."""
+        return int(self.value)
+
+
+class StubStringVar(StubVariable):
+    """Stand-in for tk.StringVar."""
+
+    def get(self) -> str:
+        """Return the value as str like tkinter does, lists and tuples as a Tcl list."""
+        if isinstance(self.value, (list, tuple)):
+            return " ".join(str(value) for value in self.value)
+        return str(self.value)
+
+
+class StubBooleanVar(StubVariable):
+    """Stand-in for tk.BooleanVar."""
+
+    default = False
+
+    def get(self) -> bool:
+        """Return the value as bool like tkinter does."""
+        return bool(self.value)
+
+
+class StubWidget:
+    """Stand-in for all tkinter and myNotebook widgets, it doesn't draw anything."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Take any arguments a widget takes."""
+
+    def winfo_children(self) -> list:
+        """Return no children, nothing got drawn."""
+        return []
+
+    def __getattr__(self, name: str):
+        """Accept any other widget method (grid, destroy, after, clipboard_append...) and do nothing."""
+        return lambda *args, **kwargs: None
+
+
+class StubConfig:
+    """Stand-in for the EDMC config, keeps the settings in memory."""
+
+    default_journal_dir = ""
+
+    def __init__(self) -> None:
+        """Start out without any settings, like a fresh EDMC installation."""
+        self.values = {}
+
+    def get_int(self, key: str, default: int = 0) -> int:
+        """Return the int setting key."""
+        return int(self.values.get(key, default))
+
+    def get_str(self, key: str, default: str = None) -> str:
+        """Return the str setting key."""
+        return self.values.get(key, default)
+
+    def set(self, key: str, value) -> None:
+        """Change the setting key."""
+        self.values[key] = value
+
+
+def install_stubs() -> None:
+    """Put stand-ins for tkinter and the modules EDMC provides to plugins into sys.modules."""
+    def module(name, **attributes):
+        stub = types.ModuleType(name)
+        stub.__dict__.update(attributes)
+        sys.modules[name] = stub
+
+    module("tkinter", IntVar=StubIntVar, StringVar=StubStringVar, BooleanVar=StubBooleanVar,
+           Frame=StubWidget, Label=StubWidget, Button=StubWidget, Tk=StubWidget,
+           N="n", S="s", E="e", W="w")
+    module("myNotebook", Notebook=StubWidget, Frame=StubWidget, Label=StubWidget,
+           Button=StubWidget, Checkbutton=StubWidget, Entry=StubWidget)
+    module("config", appname="EDMarketConnector", config=StubConfig())
+    module("theme", theme=StubWidget())
+    module("ttkHyperlinkLabel", HyperlinkLabel=StubWidget)
+    # Never ask GitHub for updates
+    module("requests", get=lambda *args, **kwargs: types.SimpleNamespace(ok=False, json=lambda: {}))
+
+
+def load_plugin(plugindir: str, settings: dict = None):
+    """Import a copy of load.py in plugindir, so that it keeps its files there, and start it like EDMC does."""
+    install_stubs()
+    sys.modules["config"].config.values.update(settings or {})
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "load.py"), plugindir)
+    spec = importlib.util.spec_from_file_location("load", os.path.join(plugindir, "load.py"))
+    plugin = importlib.util.module_from_spec(spec)
+    sys.modules["load"] = plugin
+    spec.loader.exec_module(plugin)
+    plugin.plugin_start3(plugindir)
+    plugin.plugin_app(StubWidget())
+    return plugin
+
+
+def journal_entries(journals: list):
+    """Yield every decodable entry of the journals in order, like EDMC reads them."""
+    for journal in journals:
+        with open_journal(journal) as file:
+            for line in file:
+                try:
+                    yield jsonbackend.loads(line)
+                except ValueError:
+                    continue
+
+
+def replay_live(plugin, journals: list) -> dict:
+    """
+    Feed the journals through journal_entry of the imported load.py event by event.
+
+    Return the seconds each event took by event name, the exceptions the handlers raised
+    and the unsold value the plugin shows for the Commander played last.
+    """
+    timings = collections.defaultdict(list)
+    errors = collections.Counter()
+    firsterror = {}
+    cmdr = None
+    system = ""
+    state = {"GameVersion": "4.0.0.0"}
+
+    for entry in journal_entries(journals):
+        event = entry.get("event", "")
+        # Keep track of what EDMC would hand to the plugin along with the entry
+        if event == "Commander":
+            cmdr = entry["Name"]
+        elif event == "LoadGame":
+            cmdr = entry["Commander"]
+        if event in ["Fileheader", "LoadGame"] and "gameversion" in entry.keys():
+            state["GameVersion"] = entry["gameversion"]
+        if "StarSystem" in entry.keys():
+            system = entry["StarSystem"]
+        if cmdr is None:
+            continue
+
+        start = time.perf_counter()
+        try:
+            plugin.journal_entry(cmdr, False, system, None, entry, state)
+        except Exception:
+            errors[event] += 1
+            firsterror.setdefault(event, traceback.format_exc())
+        timings[event].append(time.perf_counter() - start)
+
+    plugin.plugin_stop()
+    return {"timings": timings, "errors": errors, "firsterror": firsterror, "cmdr": cmdr,
+            "unsold_value": plugin.plugin.rawvalue}
+
+
+def replay_crawler(journaldir: str, outputdir: str, database: bool = False) -> dict:
+    """Crawl the journals with build_biodata_json into outputdir and time it."""
+    stats = {}
+    start = time.perf_counter()
+    unsoldvalue = build_biodata_json(logging.getLogger("journalreplay"), journaldir, outputdir=outputdir, stats=stats,
+                                     database=database)
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "stats": stats, "unsold_value": unsoldvalue}
+
+
+def read_stores(directory: str) -> tuple:
+    """
+    Read the soldbiodata.json and notsoldbiodata.json in directory.
+
+    Return the sold scans as {(cmdr, system, body, species): letter} and the unsold ones as a Counter.
+    """
+    solddata = biodataformat.read(os.path.join(directory, "soldbiodata.json"))
+    notsolddata = biodataformat.read(os.path.join(directory, "notsoldbiodata.json"))
+
+    sold = {}
+    for cmdr in solddata.keys():
+        for letter in solddata[cmdr]:
+            for system in solddata[cmdr][letter]:
+                for item in solddata[cmdr][letter][system]:
+                    sold[(cmdr, item["system"], item["body"], item["species"])] = letter
+    unsold = collections.Counter()
+    for cmdr in notsolddata.keys():
+        for item in notsolddata[cmdr]:
+            unsold[(cmdr, item["system"], item["body"], item["species"])] += 1
+    return sold, unsold
+
+
+def diff_stores(crawlerdir: str, livedir: str) -> dict:
+    """Diff the stores the crawler and the live handlers left behind."""
+    crawlersold, crawlerunsold = read_stores(crawlerdir)
+    livesold, liveunsold = read_stores(livedir)
+    return {
+        "sold_only_crawler": sorted(set(crawlersold) - set(livesold)),
+        "sold_only_live": sorted(set(livesold) - set(crawlersold)),
+        "sold_other_letter": sorted(key for key in set(crawlersold) & set(livesold)
+                                    if crawlersold[key] != livesold[key]),
+        "unsold_only_crawler": sorted((crawlerunsold - liveunsold).elements()),
+        "unsold_only_live": sorted((liveunsold - crawlerunsold).elements()),
+        "sold": (len(crawlersold), len(livesold)),
+        "unsold": (sum(crawlerunsold.values()), sum(liveunsold.values())),
+    }
+
+
+def latency(seconds: list) -> dict:
+    """Summarise a list of handler times in milliseconds."""
+    ordered = sorted(seconds)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(1000 * sum(ordered) / len(ordered), 4),
+        "p50_ms": round(1000 * ordered[len(ordered) // 2], 4),
+        "p95_ms": round(1000 * ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)], 4),
+        "max_ms": round(1000 * ordered[-1], 4),
+    }
+
+
+def replay(journaldir: str, files: int = None, keep: bool = False, sqlite: bool = False) -> dict:
+    """Replay the journals through both paths and return the report, with sqlite both use the exobiology.db."""
+    workdir = tempfile.mkdtemp(prefix="journalreplay")
+    crawlerdir = os.path.join(workdir, "crawler")
+    livedir = os.path.join(workdir, "ArtemisScannerTracker")
+    os.makedirs(crawlerdir)
+    os.makedirs(livedir)
+    try:
+        journals = journal_files(journaldir)
+        if files is not None:
+            journals = journals[:files]
+            # The crawler gets exactly the same journals
+            journaldir = os.path.join(workdir, "journals")
+            os.makedirs(journaldir)
+            for journal in journals:
+                with open_journal(journal) as source, \
+                        open(os.path.join(journaldir, os.path.basename(journalname(journal)).removesuffix(".gz")),
+                             "wb") as target:
+                    shutil.copyfileobj(source, target)
+            journals = journal_files(journaldir)
+
+        crawler = replay_crawler(journaldir, crawlerdir, sqlite)
+        live = replay_live(load_plugin(livedir, {"AST_sqlite": 1} if sqlite else None), journals)
+        if sqlite:
+            # Diffed like the json files
+            for directory in [crawlerdir, livedir]:
+                database = biodatabase.BiodataDatabase(os.path.join(directory, biodatabase.DATABASE_FILE))
+                database.export_json(directory)
+                database.close()
+
+        # The plugin only shows the unsold value of the current Commander, the crawler returns the one of all
+        notsolddata = biodataformat.read(os.path.join(crawlerdir, "notsoldbiodata.json"))
+        crawlervalue = unsold_value({live["cmdr"]: notsolddata.get(live["cmdr"], [])})
+
+        events = crawler["stats"]["skipped"] + crawler["stats"]["decoded"]
+        alllive = [seconds for timings in live["timings"].values() for seconds in timings]
+        report = {
+            "journals": len(journals),
+            "events": events,
+            "diff": diff_stores(crawlerdir, livedir),
+            "cmdr": live["cmdr"],
+            "unsold_value": (crawlervalue, live["unsold_value"]),
+            "crawler": {"seconds": round(crawler["seconds"], 3),
+                        "mean_ms": round(1000 * crawler["seconds"] / events, 4) if events else None},
+            "live": {"seconds": round(sum(alllive), 3), "all": latency(alllive) if alllive else None,
+                     "events": {event: latency(timings) for event, timings in sorted(live["timings"].items())
+                                if event in ["ScanOrganic", "SellOrganicData", "Resurrect", "Location", "FSDJump",
+                                             "Touchdown", "Liftoff", "Embark", "Disembark"]}},
+            "errors": dict(live["errors"]),
+            "firsterror": live["firsterror"],
+            "workdir": workdir,
+        }
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def differs(report: dict) -> bool:
+    """Tell if the crawler and the live handlers came to different results."""
+    diff = report["diff"]
+    return any(diff[key] != [] for key in ["sold_only_crawler", "sold_only_live", "sold_other_letter",
+                                           "unsold_only_crawler", "unsold_only_live"]) \
+        or report["unsold_value"][0] != report["unsold_value"][1]
+
+
+def print_report(report: dict, examples: int = 5) -> None:
+    """Print the report in a human readable way."""
+    diff = report["diff"]
+    print(f"Replayed {report['events']:,} events of {report['journals']} journals")
+    print(f"    sold scans: crawler {diff['sold'][0]:,}, live {diff['sold'][1]:,}")
+    print(f"    unsold scans: crawler {diff['unsold'][0]:,}, live {diff['unsold'][1]:,}")
+    print(f"    unsold value of {report['cmdr']}: crawler {report['unsold_value'][0]:,} Cr., "
+          + f"live {report['unsold_value'][1]:,} Cr.")
+    for key in ["sold_only_crawler", "sold_only_live", "sold_other_letter", "unsold_only_crawler", "unsold_only_live"]:
+        if diff[key] != []:
+            print(f"    {key}: {len(diff[key])}")
+            for item in diff[key][:examples]:
+                print(f"        {item}")
+    print("Result: " + ("DIFFERENT" if differs(report) else "same"))
+
+    print(f"Crawler: {report['crawler']['seconds']} s, {report['crawler']['mean_ms']} ms per event")
+    print(f"Live handlers: {report['live']['seconds']} s, {report['live']['all']}")
+    for event, summary in report["live"]["events"].items():
+        print(f"    {event}: {summary}")
+    for event, count in report["errors"].items():
+        print(f"Live handler raised on {count} {event} events, first one:")
+        print(report["firsterror"][event])
+
+
+def main(argv: list = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Replay journals through the journalcrawler and the live "
+                                                 + "event handlers and diff the results.")
+    parser.add_argument("journaldir", help="journal folder or archive")
+    parser.add_argument("--files", type=int, help="only replay the first FILES journals")
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    parser.add_argument("--keep", action="store_true", help="keep the stores of both paths")
+    parser.add_argument("--sqlite", action="store_true", help="keep the exobiology in the exobiology.db on both paths")
+    args = parser.parse_args(argv)
+
+    report = replay(args.journaldir, args.files, args.keep, args.sqlite)
+    if args.json:
+        print(jsonbackend.dumps(report, indent=True))
+    else:
+        print_report(report)
+    if args.keep:
+        print(f"Stores are in {report['workdir']}")
+    sys.exit(1 if differs(report) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+JSON reading and writing for the journals and the files of the plugin.
+
+Uses orjson when it can be imported as it is a lot faster at both
+and falls back to the json module of the standard library otherwise.
+Pretty printed files are indented by 2 spaces with orjson and by 4 with json,
+either backend reads what the other one wrote.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Available backends, fastest first
+BACKENDS = ["json"] if orjson is None else ["orjson", "json"]
+
+backend = BACKENDS[0]
+
+
+def use(name: str) -> None:
+    """Switch to another of the BACKENDS, e.g. to compare them."""
+    global backend
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend {name} is not available, only {', '.join(BACKENDS)}")
+    backend = name
+
+
+def loads(data):
+    """Decode a JSON document from a str or bytes."""
+    if backend == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(file):
+    """Decode the JSON document in a file opened for reading."""
+    return loads(file.read())
+
+
+def dumps(obj, indent: bool = False) -> str:
+    """Encode obj as a JSON document on a single line or pretty printed with indent."""
+    if backend == "orjson":
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf8")
+    if indent:
+        return json.dumps(obj, indent=4)
+    return json.dumps(obj)
+
+
+def dump(obj, file, indent: bool = False) -> None:
+    """Write obj as a JSON document into a file opened in text mode."""
+    file.write(dumps(obj, indent))
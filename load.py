@@ -1,8 +1,10 @@
 """Artemis Scanner Tracker v0.2.6 by Balvald."""
 
-import json
 import logging
 import os
+import queue
+import threading
+import time
 import tkinter as tk
 from typing import Optional
 
@@ -12,8 +14,12 @@ from config import appname, config  # type: ignore
 from theme import theme  # type: ignore
 from ttkHyperlinkLabel import HyperlinkLabel  # type: ignore
 
+import biodataformat
+import biodatalog
+import biodatastore
+import jsonbackend
 import organicinfo as orgi
-from journalcrawler import build_biodata_json
+from journalcrawler import CrawlCancelled, build_biodata_json, unsold_value
 
 frame: Optional[tk.Frame] = None
 
@@ -46,17 +52,24 @@ plugin = None
 # tracking of all the biological things that the CMDR scans.
 directory, filename = os.path.split(os.path.realpath(__file__))
 
-filenames = ["\\soldbiodata.json", "\\notsoldbiodata.json",  "\\cmdrstates.json"]
+filenames = ["soldbiodata.json", "notsoldbiodata.json"]
 
+# Older versions built the paths with backslashes, so when not running on Windows
+# they wrote the files next to the plugin folder instead of into it.
+# The cmdrstates.json left there is split up by the store, see BiodataStore.split_states.
 for file in filenames:
-    if not os.path.exists(directory + file):
-        f = open(directory + file, "w", encoding="utf8")
+    if not os.path.exists(os.path.join(directory, file)) and os.path.exists(directory + "\\" + file):
+        os.replace(directory + "\\" + file, os.path.join(directory, file))
+
+for file in filenames:
+    if not os.path.exists(os.path.join(directory, file)):
+        f = open(os.path.join(directory, file), "w", encoding="utf8")
         f.write(r"{}")
         f.close()
-    elif file == "\\soldbiodata.json" or file == "\\notsoldbiodata.json":
+    elif file == "soldbiodata.json" or file == "notsoldbiodata.json":
         # (not)soldbiodata file already exists
-        with open(directory + file, "r+", encoding="utf8") as f:
-            test = json.load(f)
+        with open(os.path.join(directory, file), "r+", encoding="utf8") as f:
+            test = jsonbackend.load(f)
             if type([]) == type(test):
                 # we have an old version of the (not)soldbiodata.json
                 # clear it, have the user do the journal crawling again.
@@ -65,14 +78,26 @@ for file in filenames:
                 f.seek(0)
                 f.write(r"{}")
                 f.truncate()
+        if isinstance(test, dict) and not biodataformat.is_compact(test):
+            # plain layout of earlier versions, convert it to the compact format
+            logger.info(f"Converting {file} to the compact format")
+            biodataformat.write(os.path.join(directory, file), test)
+
+# From here on the stores are kept in memory and saved by a writer thread, see biodatastore.py.
+# With the option set the exobiology is kept in the exobiology.db instead, see biodatabase.py.
+# The first time it takes over the json files.
+# Only the sold exobiology of the systems used lately is kept in memory.
+store = biodatastore.BiodataStore(logger, directory,
+                                  config.get_int("AST_flush_interval", default=biodatastore.FLUSH_INTERVAL),
+                                  database=bool(config.get_int("AST_sqlite")),
+                                  budget=config.get_int("AST_cache_budget", default=biodatastore.CACHE_BUDGET))
 
 # load notyetsolddata
 
-with open(directory + "\\notsoldbiodata.json", "r+", encoding="utf8") as f:
-    not_yet_sold_data = json.load(f)
+not_yet_sold_data = store.unsold()
 
-with open(directory + "\\cmdrstates.json", "r+", encoding="utf8") as f:
-    cmdrstates = json.load(f)
+# States of the Commanders seen so far, read from their files when first needed
+cmdrstates = {}
 
 
 class ArtemisScannerTracker:
@@ -102,6 +127,15 @@ class ArtemisScannerTracker:
         # option for shorterned numbers
         self.AST_shorten_value: Optional[tk.IntVar] = tk.IntVar(value=config.get_int("AST_shorten_value"))
 
+        # option to keep the exobiology in a SQLite database instead of the json files
+        self.AST_sqlite: Optional[tk.IntVar] = tk.IntVar(value=config.get_int("AST_sqlite"))
+        # seconds between two saves of the stores, scans and sells are logged right away (see biodatalog.py)
+        self.AST_flush_interval: Optional[tk.StringVar] = tk.StringVar(
+            value=str(config.get_int("AST_flush_interval", default=biodatastore.FLUSH_INTERVAL)))
+        # megabytes of sold exobiology kept in memory
+        self.AST_cache_budget: Optional[tk.StringVar] = tk.StringVar(
+            value=str(config.get_int("AST_cache_budget", default=biodatastore.CACHE_BUDGET)))
+
         # bool to steer when the CCR feature is visible
         self.AST_near_planet: Optional[tk.BooleanVar] = False
 
@@ -147,6 +181,20 @@ class ArtemisScannerTracker:
 
         self.AST_value: Optional[tk.StringVar] = tk.StringVar(value=((f"{self.rawvalue:,} Cr.")))
 
+        # journal crawl running in the background, reports back to the Tk thread through crawlqueue
+        self.AST_crawl_status: Optional[tk.StringVar] = tk.StringVar(value="")
+        self.crawlthread: Optional[threading.Thread] = None
+        self.crawlcancel = threading.Event()
+        self.crawlqueue = queue.Queue()
+
+        # timestamp of the last journal event the plugin saw, to catch up on what it missed on the next start
+        self.AST_last_event = str(config.get_str("AST_last_event") or "")
+        # journal events held back while catching up, they are handled once that is done
+        self.backfilling = False
+        self.heldevents = []
+        # timestamp the catching up crawls up to, held events up to it are in the crawl already
+        self.backfilluntil = ""
+
         self.updateavailable = False
 
         response = requests.get(f"https://api.github.com/repos/{AST_REPO}/releases/latest")
@@ -180,7 +228,14 @@ class ArtemisScannerTracker:
         It is the last thing called before EDMC shuts down.
         Note that blocking code here will hold the shutdown process.
         """
+        if self.crawlthread is not None and self.crawlthread.is_alive():
+            # A cancelled crawl stops after the journal it is reading without saving anything
+            self.crawlcancel.set()
+            self.crawlthread.join(timeout=5)
+        if self.crawlthread is None or not self.crawlthread.is_alive():
+            store.release()
         self.on_preferences_closed("", False)  # Save our prefs
+        store.stop()
 
     def setup_preferences(self, parent: nb.Notebook, cmdr: str, is_beta: bool) -> Optional[tk.Frame]: # noqa #CCR001
         """
@@ -272,6 +327,24 @@ class ArtemisScannerTracker:
         current_row += 1
 
         prefs_tickbutton(frame, "Shorten credit values", self.AST_shorten_value, current_row, 0, tk.W)
+        prefs_tickbutton(frame, "Keep exobiology in a SQLite database", self.AST_sqlite, current_row, 1, tk.W)
+
+        current_row += 1
+
+        prefs_label(frame, "Save every x seconds (0 = every change)", current_row, 0, tk.W)
+        prefs_input(frame, self.AST_flush_interval, current_row, 1, tk.W)
+
+        current_row += 1
+
+        prefs_label(frame, "Keep up to x MB of sold exobiology in memory", current_row, 0, tk.W)
+        prefs_input(frame, self.AST_cache_budget, current_row, 1, tk.W)
+
+        current_row += 1
+
+        stats = store.cache_stats()
+        text = (f"In memory: {stats['shards']} of {store.shardcount} parts, {stats['bytes'] / 1024 / 1024:.1f} MB "
+                + f"({stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} dropped)")
+        prefs_label(frame, text, current_row, 0, tk.W)
 
         current_row += 1
 
@@ -287,6 +360,11 @@ class ArtemisScannerTracker:
 
         current_row += 1
 
+        prefs_entry(frame, self.AST_crawl_status, current_row, 0, tk.W)
+        prefs_button(frame, "Cancel scan", self.cancelcrawl, current_row, 1, tk.W)
+
+        current_row += 1
+
         prefs_label(frame, line, current_row, 0, tk.W)
         prefs_label(frame, line, current_row, 1, tk.W)
 
@@ -355,10 +433,39 @@ class ArtemisScannerTracker:
 
         config.set("AST_shorten_value", int(self.AST_shorten_value.get()))
 
+        if bool(self.AST_sqlite.get()) != store.database:
+            if self.crawlthread is not None and self.crawlthread.is_alive():
+                # The running crawl keeps using where the exobiology was when it started
+                self.AST_sqlite.set(int(store.database))
+                self.AST_crawl_status.set("Switch the storage again once the journal scan is done")
+            else:
+                store.switch(bool(self.AST_sqlite.get()))
+        config.set("AST_sqlite", int(self.AST_sqlite.get()))
+
+        try:
+            interval = max(0, int(self.AST_flush_interval.get()))
+        except ValueError:
+            interval = store.interval
+        self.AST_flush_interval.set(str(interval))
+        if interval != store.interval:
+            store.set_interval(interval)
+        config.set("AST_flush_interval", interval)
+
+        try:
+            budget = max(1, int(self.AST_cache_budget.get()))
+        except ValueError:
+            budget = store.budget
+        self.AST_cache_budget.set(str(budget))
+        if budget != store.budget:
+            store.set_budget(budget)
+        config.set("AST_cache_budget", budget)
+
         config.set("AST_after_selling", int(self.AST_after_selling.get()))
 
         config.set("AST_hide_scans_in_system", int(self.AST_hide_scans_in_system.get()))
 
+        config.set("AST_last_event", str(self.AST_last_event))
+
         logger.debug(f"Currently last Commander is: {cmdr}")
 
         config.set("AST_last_CMDR", str(cmdr))
@@ -388,6 +495,8 @@ class ArtemisScannerTracker:
 
         rebuild_ui(self, currentcommander)
 
+        self.backfill()
+
         return frame
 
     def reset(self) -> None:
@@ -429,14 +538,15 @@ class ArtemisScannerTracker:
         global logger
         directory, filename = os.path.split(os.path.realpath(__file__))
 
-        self.rawvalue = build_biodata_json(logger, os.path.join(directory, "journals"))
+        self.startcrawl(os.path.join(directory, "journals"), checkpoint=True, digest=True)
 
     def buildsoldbiodatajson(self) -> None:
         """Build the soldbiodata.json using the neighboring journalcrawler.py."""
         # Always uses the game journal directory
+        self.startcrawl(self.gamejournaldir(), checkpoint=True, digest=True)
 
-        global logger
-
+    def gamejournaldir(self) -> str:
+        """Return the journal directory of the game."""
         # this the actual path from the config.
         journaldir = config.get_str('journaldir')
 
@@ -444,7 +554,112 @@ class ArtemisScannerTracker:
             # config.default_journal_dir is a fallback that won't work in a linux context
             journaldir = config.default_journal_dir
 
-        self.rawvalue = build_biodata_json(logger, journaldir)
+        return journaldir
+
+    def backfill(self) -> None:
+        """
+        Catch up on scans and sells of sessions played while EDMC was not running.
+
+        Only the game journals written since the last event the plugin saw are crawled,
+        journal events coming in meanwhile are held back until the crawl is done.
+        """
+        global logger
+        if self.AST_last_event == "":
+            # Never saw an event, nothing to catch up to.
+            return
+        until = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        logger.info(f"Catching up on journal events from {self.AST_last_event} to {until}")
+        self.backfilling = True
+        self.backfilluntil = until
+        self.startcrawl(self.gamejournaldir(), since=self.AST_last_event, until=until, digest=True)
+
+    def startcrawl(self, journaldir: str, **kwargs) -> None:
+        """Start crawling journaldir in a background thread so the EDMC window stays responsive."""
+        global frame
+        if self.crawlthread is not None and self.crawlthread.is_alive():
+            self.AST_crawl_status.set("A journal scan is already running")
+            return
+
+        # The crawler works on the saved stores, so they need everything so far
+        store.hold()
+        kwargs["database"] = store.database
+        self.crawlcancel.clear()
+        self.AST_crawl_status.set("Scanning journals...")
+        self.crawlthread = threading.Thread(target=self.crawl, args=(journaldir,), kwargs=kwargs,
+                                            name="AST journal crawl", daemon=True)
+        self.crawlthread.start()
+        frame.after(200, self.crawlpoll)
+
+    def cancelcrawl(self) -> None:
+        """Cancel the running journal crawl, it stops after the current journal without saving anything."""
+        if self.crawlthread is not None and self.crawlthread.is_alive():
+            self.crawlcancel.set()
+            self.AST_crawl_status.set("Cancelling journal scan...")
+
+    def crawl(self, journaldir: str, **kwargs) -> None:
+        """Run the journal crawl, called in the crawl thread. Never touches Tk, results go through crawlqueue."""
+        global logger
+        stats = {}
+        try:
+            value = build_biodata_json(logger, journaldir, stats=stats,
+                                       progress=lambda done: self.crawlqueue.put(("progress", done)),
+                                       cancel=self.crawlcancel, **kwargs)
+        except CrawlCancelled:
+            self.crawlqueue.put(("cancelled", None))
+        except Exception as e:
+            logger.exception("Journal scan failed")
+            self.crawlqueue.put(("failed", str(e)))
+        else:
+            self.crawlqueue.put(("done", (value, stats)))
+
+    def crawlpoll(self) -> None:
+        """Apply what the crawl thread reported on the Tk thread, reschedules itself until the crawl is over."""
+        global frame, currentcommander, not_yet_sold_data
+        running = self.crawlthread is not None and self.crawlthread.is_alive()
+        while True:
+            try:
+                kind, data = self.crawlqueue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                if not self.crawlcancel.is_set():
+                    self.AST_crawl_status.set(crawlprogressstring(data))
+            elif kind in ["cancelled", "failed"]:
+                store.release()
+                if kind == "cancelled":
+                    self.AST_crawl_status.set("Journal scan cancelled")
+                else:
+                    self.AST_crawl_status.set(f"Journal scan failed: {data}")
+                if self.backfilling:
+                    logger.warning("Could not catch up on missed journal events, scan the game journals to do so")
+            elif kind == "done":
+                value, stats = data
+                if stats.get("lastevent", "") > self.AST_last_event:
+                    self.AST_last_event = stats["lastevent"]
+                # Scans and sells that came in during the crawl go on top of what it found
+                store.release()
+                not_yet_sold_data = store.unsold()
+                if currentcommander != "":
+                    # The crawl adds up the unsold scans of every Commander, only the current one's are shown
+                    self.rawvalue = unsold_value({currentcommander: not_yet_sold_data.get(currentcommander, [])})
+                    if self.AST_shorten_value.get():
+                        self.AST_value.set(shortcreditstring(self.rawvalue))
+                    else:
+                        self.AST_value.set(f"{self.rawvalue:,} Cr.")
+                    config.set("AST_value", int(self.rawvalue))
+                self.AST_crawl_status.set("Journal scan finished")
+                rebuild_ui(self, currentcommander)
+        if running:
+            frame.after(200, self.crawlpoll)
+        elif self.backfilling:
+            # Caught up, now the events that came in meanwhile
+            self.backfilling = False
+            heldevents = self.heldevents
+            self.heldevents = []
+            for event in heldevents:
+                # The crawl includes the whole second of until, so those events were counted already
+                if event[4].get("timestamp", "") > self.backfilluntil:
+                    journal_entry(*event)
 
 
 # region eventhandling
@@ -469,7 +684,7 @@ def dashboard_entry(cmdr: str, is_beta, entry) -> None:  # noqa #CCR001
         # Check if new and old Commander are in the cmdrstates file.
         save_cmdr(currentcommander)
         # New Commander not in cmdr states file.
-        if cmdr not in cmdrstates.keys():
+        if cmdr not in cmdrstates.keys() and store.cmdrstate(cmdr) is None:
             # completely new cmdr theres nothing to load
             cmdrstates[cmdr] = ["None", "None", "None", "0/3", "None", 0, "None", "None", "None"]
         else:
@@ -572,6 +787,11 @@ def journal_entry(cmdr: str, is_beta: bool, system: str, station: str, entry, st
     """
     global plugin, currentcommander
 
+    if plugin.backfilling:
+        # Still catching up on what happened while EDMC was not running
+        plugin.heldevents.append((cmdr, is_beta, system, station, entry, state))
+        return
+
     if (int(state["GameVersion"][0]) < 4) and (plugin.AST_in_Legacy is False):
         # We're in Legacy, we'll not change the state of anything through journal entries.
         plugin.AST_in_Legacy = True
@@ -579,11 +799,14 @@ def journal_entry(cmdr: str, is_beta: bool, system: str, station: str, entry, st
     else:
         plugin.AST_in_Legacy = False
 
+    if entry.get("timestamp", "") > plugin.AST_last_event:
+        plugin.AST_last_event = entry["timestamp"]
+
     if currentcommander != cmdr and currentcommander != "" and currentcommander is not None:
         # Check if new and old Commander are in the cmdrstates file.
         save_cmdr(currentcommander)
         # New Commander not in cmdr states file.
-        if cmdr not in cmdrstates.keys():
+        if cmdr not in cmdrstates.keys() and store.cmdrstate(cmdr) is None:
             # completely new cmdr theres nothing to load
             cmdrstates[cmdr] = ["None", "None", "None", "0/3", "None", 0, "None", "None", "None"]
         else:
@@ -694,15 +917,7 @@ def bioscan_event(cmdr: str, is_beta, entry) -> None:  # noqa #CCR001
                 # If there is no second Sample scantype event
                 # we have to save the data here.
                 not_yet_sold_data[cmdr].append(currententrytowrite)
-                file = directory + "\\notsoldbiodata.json"
-                with open(file, "r+", encoding="utf8") as f:
-                    notsolddata = json.load(f)
-                    if cmdr not in notsolddata.keys():
-                        notsolddata[cmdr] = []
-                    notsolddata[cmdr].append(currententrytowrite)
-                    f.seek(0)
-                    json.dump(notsolddata, f, indent=4)
-                    f.truncate()
+                log_biodata(biodatalog.scan_record(cmdr, currententrytowrite))
                 currententrytowrite = {}
         else:
             notthesame = (not (old_AST_last_scan_system == plugin.AST_last_scan_system.get()
@@ -805,9 +1020,10 @@ def system_body_change_event(cmdr: str, entry) -> None:  # noqa #CCR001
         plugin.AST_last_scan_system.set(entry["StarSystem"])
         plugin.AST_last_scan_body.set(entry["Body"])
 
-    if cmdrstates[cmdr][1] == "" or cmdrstates[cmdr][2] == "":
-        cmdrstates[cmdr][1] = plugin.AST_last_scan_system.get()
-        cmdrstates[cmdr][2] = plugin.AST_last_scan_body.get()
+    state = cmdr_state(cmdr)
+    if state[1] == "" or state[2] == "":
+        state[1] = plugin.AST_last_scan_system.get()
+        state[2] = plugin.AST_last_scan_body.get()
         save_cmdr(cmdr)
 
 
@@ -940,24 +1156,6 @@ def biosell_event(cmdr: str, entry) -> None:  # noqa #CCR001
                     continue
             i += 1
 
-        f = open(directory + "\\notsoldbiodata.json", "r+", encoding="utf8")
-        scanneddata = json.load(f)
-        scanneddata[cmdr] = []
-        f.seek(0)
-        json.dump(scanneddata, f, indent=4)
-        f.truncate()
-        f.close()
-
-        if not_yet_sold_data[cmdr] != []:
-            file = directory + "\\notsoldbiodata.json"
-            with open(file, "r+", encoding="utf8") as f:
-                notsolddata = json.load(f)
-                for data in not_yet_sold_data[cmdr]:
-                    notsolddata[cmdr].append(data)
-                f.seek(0)
-                json.dump(notsolddata, f, indent=4)
-                f.truncate()
-
     else:
         # CMDR sold the whole batch.
         for data in not_yet_sold_data[cmdr]:
@@ -982,13 +1180,6 @@ def biosell_event(cmdr: str, entry) -> None:  # noqa #CCR001
         logger.info('Set Unsold Scan Value to 0 Cr')
         plugin.AST_value.set("0 Cr.")
         plugin.rawvalue = 0
-        f = open(directory + "\\notsoldbiodata.json", "r+", encoding="utf8")
-        scanneddata = json.load(f)
-        scanneddata[cmdr] = []
-        f.seek(0)
-        json.dump(scanneddata, f, indent=4)
-        f.truncate()
-        f.close()
 
     # Remove the value of what was sold from
     # the amount of the Scanned value.
@@ -1010,25 +1201,9 @@ def biosell_event(cmdr: str, entry) -> None:  # noqa #CCR001
         logger.info('Set Unsold Scan Value to 0 Cr')
         plugin.AST_value.set("0 Cr.")
         plugin.rawvalue = 0
-    # Now write the data into the local file
-    file = directory + "\\soldbiodata.json"
-    with open(file, "r+", encoding="utf8") as f:
-        solddata = json.load(f)
-
-        if cmdr not in solddata.keys():
-            solddata[cmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
-
-        if sold_exobiology[cmdr] != []:
-            for letter in sold_exobiology[cmdr]:
-                for system in sold_exobiology[cmdr][letter]:
-                    if system not in solddata[cmdr][letter].keys():
-                        solddata[cmdr][letter][system] = []
-                    for item in sold_exobiology[cmdr][letter][system]:
-                        solddata[cmdr][letter][system].append(item)
-            sold_exobiology[cmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
-        f.seek(0)
-        json.dump(solddata, f, indent=4)
-        f.truncate()
+    # Now log what was sold and what is left unsold
+    log_biodata(biodatalog.sell_record(cmdr, sold_exobiology[cmdr], not_yet_sold_data[cmdr]))
+    sold_exobiology[cmdr] = {alphabet[i]: {} for i in range(len(alphabet))}
 
     # After selling all the unsold value we finished selling and things switch to hiding things if
     # we are in autohiding mode
@@ -1049,8 +1224,23 @@ plugin = ArtemisScannerTracker()
 # region saving/loading
 
 
+def log_biodata(record: dict) -> None:
+    """Apply a scan or sell to the stores in memory, the writer thread saves it."""
+    store.apply(record)
+
+
+def cmdr_state(cmdr: str) -> list:
+    """Return the state of cmdr, read from its file the first time. Raises KeyError for a Commander without one."""
+    if cmdr not in cmdrstates.keys():
+        state = store.cmdrstate(cmdr)
+        if state is None:
+            raise KeyError(cmdr)
+        cmdrstates[cmdr] = state
+    return cmdrstates[cmdr]
+
+
 def save_cmdr(cmdr) -> None:
-    """Save information specific to the cmdr in the cmdrstates.json."""
+    """Save information specific to the cmdr in its state file, if anything changed."""
     global plugin, directory
 
     if cmdr not in cmdrstates.keys():
@@ -1063,32 +1253,23 @@ def save_cmdr(cmdr) -> None:
     for i in range(len(cmdrstates[cmdr])):
         cmdrstates[cmdr][i] = valuelist[i]
 
-    file = directory + "\\cmdrstates.json"
-
-    open(file, "r+", encoding="utf8").close()
-    with open(file, "r+", encoding="utf8") as f:
-        f.seek(0)
-        json.dump(cmdrstates, f, indent=4)
-        f.truncate()
+    store.set_cmdrstate(cmdr, cmdrstates[cmdr])
 
 
 def load_cmdr(cmdr) -> None:
-    """Load information about a cmdr from cmdrstates.json."""
-    global cmdrstates, plugin
-    file = directory + "\\cmdrstates.json"
-
-    with open(file, "r+", encoding="utf8") as f:
-        cmdrstates = json.load(f)
-
-    plugin.AST_last_scan_plant.set(cmdrstates[cmdr][0])
-    plugin.AST_last_scan_system.set(cmdrstates[cmdr][1])
-    plugin.AST_last_scan_body.set(cmdrstates[cmdr][2])
-    plugin.AST_current_scan_progress.set(cmdrstates[cmdr][3])
-    plugin.AST_state.set(cmdrstates[cmdr][4])
-    plugin.rawvalue = int(str(cmdrstates[cmdr][5]).split(" ")[0].replace(",", ""))
-    plugin.AST_CCR.set(cmdrstates[cmdr][6])
-    plugin.AST_scan_1_pos_vector = cmdrstates[cmdr][7]
-    plugin.AST_scan_2_pos_vector = cmdrstates[cmdr][8]
+    """Load information about a cmdr from its state, only its file is read."""
+    global plugin
+
+    state = cmdr_state(cmdr)
+    plugin.AST_last_scan_plant.set(state[0])
+    plugin.AST_last_scan_system.set(state[1])
+    plugin.AST_last_scan_body.set(state[2])
+    plugin.AST_current_scan_progress.set(state[3])
+    plugin.AST_state.set(state[4])
+    plugin.rawvalue = int(str(state[5]).split(" ")[0].replace(",", ""))
+    plugin.AST_CCR.set(state[6])
+    plugin.AST_scan_1_pos_vector = state[7]
+    plugin.AST_scan_2_pos_vector = state[8]
 
 # endregion
 
@@ -1193,17 +1374,6 @@ def rebuild_ui(plugin, cmdr: str) -> None:  # noqa #CCR001
 
 def build_sold_bio_ui(plugin, cmdr: str, current_row) -> None:  # noqa #CCR001
     # Create a Button to make it shorter?
-    soldbiodata = {}
-    notsoldbiodata = {}
-
-    file = directory + "\\soldbiodata.json"
-    with open(file, "r+", encoding="utf8") as f:
-        soldbiodata = json.load(f)
-
-    file = directory + "\\notsoldbiodata.json"
-    with open(file, "r+", encoding="utf8") as f:
-        notsoldbiodata = json.load(f)
-
     ui_label(frame, "Scans in this System:", current_row, 0, tk.W)
 
     if cmdr == "" or cmdr is None or cmdr == "None":
@@ -1225,50 +1395,42 @@ def build_sold_bio_ui(plugin, cmdr: str, current_row) -> None:  # noqa #CCR001
 
     count = 0
 
-    try:
-        if plugin.AST_current_system.get() in soldbiodata[cmdr][firstletter].keys():
-            for sold in soldbiodata[cmdr][firstletter][plugin.AST_current_system.get()]:
-                bodyname = ""
-
-                # Check if body has a special name or if we have standardized names
-                if sold["system"] in sold["body"]:
-                    # no special name for planet
-                    bodyname = sold["body"].replace(sold["system"], "")[1:]
-                else:
-                    bodyname = sold["body"]
+    # Only the scans in the current system
+    soldscans, notsoldscans = store.system_scans(cmdr, firstletter, plugin.AST_current_system.get())
 
-                if sold["species"] not in bodylistofspecies.keys():
-                    bodylistofspecies[sold["species"]] = [[bodyname, True]]
-                else:
-                    bodylistofspecies[sold["species"]].append([bodyname, True])
+    for sold in soldscans:
+        bodyname = ""
 
-                count += 1
-    except KeyError:
-        # if we don't have the cmdr in the sold data yet we just pass all sold data.
-        pass
+        # Check if body has a special name or if we have standardized names
+        if sold["system"] in sold["body"]:
+            # no special name for planet
+            bodyname = sold["body"].replace(sold["system"], "")[1:]
+        else:
+            bodyname = sold["body"]
 
-    try:
-        for notsold in notsoldbiodata[cmdr]:
-            if notsold["system"] == plugin.AST_current_system.get():
+        if sold["species"] not in bodylistofspecies.keys():
+            bodylistofspecies[sold["species"]] = [[bodyname, True]]
+        else:
+            bodylistofspecies[sold["species"]].append([bodyname, True])
 
-                bodyname = ""
+        count += 1
 
-                # Check if body has a special name or if we have standardized names
-                if notsold["system"] in notsold["body"]:
-                    # no special name for planet
-                    bodyname = notsold["body"].replace(notsold["system"], "")[1:]
-                else:
-                    bodyname = notsold["body"]
+    for notsold in notsoldscans:
+        bodyname = ""
 
-                if notsold["species"] not in bodylistofspecies.keys():
-                    bodylistofspecies[notsold["species"]] = [[bodyname, False]]
-                else:
-                    bodylistofspecies[notsold["species"]].append([bodyname, False])
+        # Check if body has a special name or if we have standardized names
+        if notsold["system"] in notsold["body"]:
+            # no special name for planet
+            bodyname = notsold["body"].replace(notsold["system"], "")[1:]
+        else:
+            bodyname = notsold["body"]
 
-                count += 1
-    except KeyError:
-        # if we don't have the cmdr in the notsold data yet we just pass.
-        pass
+        if notsold["species"] not in bodylistofspecies.keys():
+            bodylistofspecies[notsold["species"]] = [[bodyname, False]]
+        else:
+            bodylistofspecies[notsold["species"]].append([bodyname, False])
+
+        count += 1
 
     if bodylistofspecies == {}:
         ui_label(frame, "None", current_row, 1, tk.W)
@@ -1298,6 +1460,17 @@ def build_sold_bio_ui(plugin, cmdr: str, current_row) -> None:  # noqa #CCR001
         ui_label(frame, bodies, current_row, 1, tk.W)
 
 
+def crawlprogressstring(done: dict) -> str:
+    """Return the status line for a running journal crawl from the progress of build_biodata_json."""
+    text = f"Scanned {done['files']}/{done['totalfiles']} journals"
+    if done["seconds"] > 0:
+        text += f", {done['events'] / done['seconds']:,.0f} events/s"
+    if done["bytes"] > 0 and done["totalbytes"] > done["bytes"]:
+        eta = done["seconds"] * (done["totalbytes"] - done["bytes"]) / done["bytes"]
+        text += ", " + time.strftime("%H:%M:%S", time.gmtime(eta)) + " left"
+    return text
+
+
 def shortcreditstring(number):
     """Create string given given number of credits with SI symbol prefix and money unit e.g. KCr. MCr. GCr. TCr."""
     if number is None:
@@ -1331,6 +1504,11 @@ def prefs_entry(frame, textvariable, row: int, col: int, sticky) -> None:
     nb.Label(frame, textvariable=textvariable).grid(row=row, column=col, sticky=sticky)
 
 
+def prefs_input(frame, textvariable, row: int, col: int, sticky) -> None:
+    """Create an input field for the preferences of the plugin."""
+    nb.Entry(frame, textvariable=textvariable).grid(row=row, column=col, sticky=sticky)
+
+
 def prefs_button(frame, text, command, row: int, col: int, sticky) -> None:
     """Create a button for the prefereces of the plugin."""
     nb.Button(frame, text=text, command=command).grid(row=row, column=col, sticky=sticky)